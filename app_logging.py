@@ -0,0 +1,132 @@
+import atexit
+import datetime
+import logging
+import os
+import queue
+import re
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FILE = 'log.txt'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+_RECORD_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - ([A-Z]+) - ')
+_READ_BLOCK_SIZE = 64 * 1024
+
+METRICS_LOG_FILE = 'metrics.jsonl'
+METRICS_LOGGER = 'metrics'
+
+_listeners = []
+_setup_lock = threading.Lock()
+
+
+# Attach a queue to a logger and start a listener thread writing to a rotating file
+def _add_queued_file_handler(logger, filename, formatter):
+    file_handler = RotatingFileHandler(
+        filename,
+        maxBytes=int(os.getenv('LOG_MAX_MB', DEFAULT_MAX_BYTES // (1024 * 1024))) * 1024 * 1024,
+        backupCount=int(os.getenv('LOG_BACKUP_COUNT', DEFAULT_BACKUP_COUNT)),
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+
+# Configure logging once per process.
+# Log calls only put records on an in-memory queue; background listener
+# threads write them to size-rotated files, so requests never wait on disk.
+# Besides log.txt, the "metrics" logger writes one JSON object per line to
+# metrics.jsonl for dashboards.
+def setup_logging(filename=LOG_FILE, level=None, metrics_filename=METRICS_LOG_FILE):
+    with _setup_lock:
+        if _listeners:
+            return
+        if level is None:
+            level = os.getenv('LOG_LEVEL', 'INFO').upper()
+        root = logging.getLogger()
+        root.setLevel(level)
+        _add_queued_file_handler(root, filename, logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+
+        metrics_logger = logging.getLogger(METRICS_LOGGER)
+        metrics_logger.propagate = False
+        _add_queued_file_handler(metrics_logger, metrics_filename, logging.Formatter('%(message)s'))
+        atexit.register(stop_logging)
+
+
+# Flush queued records and stop the writer threads
+def stop_logging():
+    with _setup_lock:
+        while _listeners:
+            _listeners.pop().stop()
+
+
+# Yield the lines of a file from last to first, reading fixed-size blocks backwards
+def _iter_lines_reversed(path):
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            read_size = min(_READ_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + remainder).split(b"\n")
+            # The first piece may be the end of a line that started in an earlier block
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode('utf-8', errors='replace').rstrip('\r')
+        if remainder:
+            yield remainder.decode('utf-8', errors='replace').rstrip('\r')
+
+
+# Yield log records newest first. Lines that do not start with a timestamp
+# (e.g. tracebacks) belong to the record above them.
+def iter_log_records_reversed(path=LOG_FILE):
+    continuation = []
+    for line in _iter_lines_reversed(path):
+        match = _RECORD_PATTERN.match(line)
+        if not match:
+            if line:
+                continuation.append(line)
+            continue
+        text = "\n".join([line] + continuation[::-1])
+        continuation = []
+        yield {
+            "time": datetime.datetime.strptime(match.group(1), LOG_DATE_FORMAT),
+            "level": match.group(2),
+            "text": text,
+        }
+
+
+# Function to read one page of log records from the end of the log file.
+# Page 0 holds the newest matching records; records are returned oldest first
+# together with a flag telling whether older matching records exist.
+def read_log_page(path=LOG_FILE, levels=None, since=None, until=None, page=0, page_size=200):
+    skip = page * page_size
+    records = []
+    has_more = False
+    for record in iter_log_records_reversed(path):
+        if until is not None and record["time"] > until:
+            continue
+        if since is not None and record["time"] < since:
+            # Records are chronological, everything further back is older still
+            break
+        if levels and record["level"] not in levels:
+            continue
+        if skip:
+            skip -= 1
+            continue
+        if len(records) == page_size:
+            has_more = True
+            break
+        records.append(record)
+    records.reverse()
+    return records, has_more
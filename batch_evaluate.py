@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import datetime
+import functools
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from app_logging import setup_logging
+from canvas_store import canvas_hash, get_canvas_store
+from pipeline import run_pipeline
+
+# Batch evaluation of exported canvases without the Streamlit UI.
+#
+#   python batch_evaluate.py exports/ --output results.jsonl --concurrency 8
+#   python batch_evaluate.py canvases.jsonl --output results.jsonl
+#
+# The input is either a directory of business_plan_*.json files saved from the
+# DATA tab or a JSONL file with one canvas per line. Every finished canvas is
+# appended to the output file straight away; re-running with the same output
+# skips canvases that already completed, so an interrupted batch resumes.
+# Finished canvases are also saved to the canvas store, like evaluations run
+# in the app, so they can be searched and reused there.
+
+
+# Function to read (id, canvas) pairs from a directory or JSONL file
+def load_canvases(input_path, pattern="business_plan_*.json"):
+    path = Path(input_path)
+    if path.is_dir():
+        for file_path in sorted(path.glob(pattern)):
+            try:
+                with open(file_path, 'r') as f:
+                    yield file_path.name, json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.error(f"Skipping unreadable canvas {file_path}: {str(e)}")
+    else:
+        with open(path, 'r') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield f"{path.name}:{line_number}", json.loads(line)
+                except json.JSONDecodeError as e:
+                    logging.error(f"Skipping invalid JSON on line {line_number} of {path}: {str(e)}")
+
+
+# Function to collect the ids already evaluated successfully in a previous run
+def load_completed_ids(output_path):
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line; that canvas is simply redone
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+
+def _append_result(output_file, record):
+    output_file.write(json.dumps(record) + "\n")
+    output_file.flush()
+    os.fsync(output_file.fileno())
+
+
+# Function to evaluate one canvas and save it to the canvas store (runs in a worker thread)
+def _evaluate_and_save(api_key, canvas_id, business_model_data, use_cache, fan_out, structured):
+    started = time.perf_counter()
+    results = run_pipeline(api_key, business_model_data, use_cache, fan_out, structured=structured)
+    run_id = get_canvas_store().save_run(
+        business_model_data,
+        initial_analysis=results["initial_analysis"],
+        critique=results["critique"],
+        optimization=results["optimization"],
+        metadata={
+            "models": results["models"],
+            "bypass_cache": not use_cache,
+            "parallel_components": fan_out,
+            "structured_output": structured,
+            "refreshed_sections": results["refreshed"],
+            "token_usage": results["token_usage"],
+            "duration_seconds": round(time.perf_counter() - started, 3),
+            "batch_canvas_id": canvas_id,
+        }
+    )
+    return dict(results, run_id=run_id)
+
+
+async def _evaluate_canvas(semaphore, executor, api_key, canvas_id, business_model_data, use_cache, fan_out,
+                          structured, output_file):
+    async with semaphore:
+        started = time.perf_counter()
+        record = {"id": canvas_id, "canvas_hash": canvas_hash(business_model_data)}
+        try:
+            loop = asyncio.get_running_loop()
+            evaluate = functools.partial(_evaluate_and_save, api_key, canvas_id, business_model_data, use_cache,
+                                         fan_out, structured)
+            results = await loop.run_in_executor(executor, evaluate)
+            record.update(status="ok", **results)
+            logging.info(f"Batch evaluation completed for {canvas_id}")
+        except Exception as e:
+            record.update(status="error", error=str(e))
+            logging.error(f"Batch evaluation failed for {canvas_id}: {str(e)}")
+        record["duration_seconds"] = round(time.perf_counter() - started, 3)
+        record["completed_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+        # Results are written from the event loop thread only, one line at a time
+        _append_result(output_file, record)
+        return record["status"]
+
+
+# Function to evaluate every pending canvas with at most `concurrency` pipelines in flight
+async def evaluate_batch(input_path, output_path, api_key, concurrency=4, use_cache=True, fan_out=False,
+                         structured=False):
+    completed = load_completed_ids(output_path)
+    pending = [(canvas_id, data) for canvas_id, data in load_canvases(input_path)
+               if canvas_id not in completed]
+    print(f"{len(completed)} canvases already evaluated, {len(pending)} to go")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    # The pipeline streams through the blocking GROQ client, one worker thread per slot
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, open(output_path, 'a') as output_file:
+        tasks = [
+            asyncio.create_task(_evaluate_canvas(semaphore, executor, api_key, canvas_id, data,
+                                                 use_cache, fan_out, structured, output_file))
+            for canvas_id, data in pending
+        ]
+        ok = failed = 0
+        for task in asyncio.as_completed(tasks):
+            if await task == "ok":
+                ok += 1
+            else:
+                failed += 1
+            print(f"[{ok + failed}/{len(tasks)}] {ok} ok, {failed} failed", flush=True)
+    return ok, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate business model canvases in batch")
+    parser.add_argument("input", help="Directory of business_plan_*.json files or a JSONL file of canvases")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of pipelines running at once")
+    parser.add_argument("--api-key", default=None, help="GROQ API key (defaults to GROQ_API_KEY)")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the completion cache")
+    parser.add_argument("--fan-out", action="store_true",
+                        help="Analyze the nine canvas components as parallel requests in Step 1")
+    parser.add_argument("--structured", action="store_true",
+                        help="Have each step answer per canvas component (results include the parsed sections)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    setup_logging()
+
+    api_key = args.api_key or os.getenv('GROQ_API_KEY')
+    if not api_key:
+        parser.error("no GROQ API key given; pass --api-key or set GROQ_API_KEY")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    ok, failed = asyncio.run(evaluate_batch(args.input, args.output, api_key,
+                                            concurrency=args.concurrency, use_cache=not args.no_cache,
+                                            fan_out=args.fan_out, structured=args.structured))
+    logging.info(f"Batch evaluation finished: {ok} ok, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import percentile
+from mock_groq_server import DEFAULT_RESPONSE_TEXT, MockGroqConfig, start_mock_server
+from job_queue import EvaluationJob
+from pipeline import generate_completion, run_pipeline
+from stream_renderer import format_output, stream_refresh_interval
+
+# Benchmarks for the evaluation pipeline against the local mock GROQ server,
+# so results cost no quota and are free of network noise.
+#
+#   python benchmark.py --output bench.json
+#   python benchmark.py --sessions 8 --chunk-delay 0.005 --compare bench.json
+#
+# Scenarios: single completions, full pipelines under N concurrent sessions,
+# memory per pipeline run, and rendering of streamed text.
+# Results are written as JSON so runs on different commits can be compared.
+# The rate limiter is opened up by default so the runs measure the pipeline;
+# time spent waiting in it is reported separately as queue_wait_seconds.
+
+BENCH_API_KEY = "gsk_benchmark"
+# Limits high enough that the rate limiter never holds a benchmark request back
+BENCH_REQUESTS_PER_MINUTE = 1000000
+BENCH_TOKENS_PER_MINUTE = 1000000000
+
+
+# Function to summarize a list of measurements
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def _canvas(index):
+    return {
+        "value_proposition": f"Benchmark canvas {index}: automated workflow software for manufacturers.",
+        "customer_profile": "Operations managers at mid-sized manufacturing companies.",
+        "revenue_streams": "Monthly subscriptions and implementation services.",
+    }
+
+
+# Sequential single completions: latency and time to first token, both
+# without the time spent waiting in the rate limiter
+def bench_completion(iterations):
+    durations, ttfts, queue_waits, errors = [], [], [], 0
+    for index in range(iterations):
+        stats = {}
+        try:
+            generate_completion(BENCH_API_KEY, f"Benchmark prompt {index} {time.time()}", use_cache=False, stats=stats)
+            queue_wait = stats.get("queue_wait_seconds", 0.0)
+            queue_waits.append(queue_wait)
+            durations.append(stats["duration_seconds"] - queue_wait)
+            if "ttft_seconds" in stats:
+                ttfts.append(stats["ttft_seconds"])
+        except Exception:
+            errors += 1
+    return {"duration_seconds": summarize(durations), "ttft_seconds": summarize(ttfts),
+            "queue_wait_seconds": summarize(queue_waits), "errors": errors}
+
+
+# Full three-step pipelines from N concurrent sessions: latency (without rate
+# limiter waits, which are reported on their own) and throughput
+def bench_pipeline(sessions, runs_per_session):
+    def session(session_index):
+        latencies, queue_waits, errors = [], [], 0
+        for run_index in range(runs_per_session):
+            started = time.perf_counter()
+            try:
+                results = run_pipeline(BENCH_API_KEY, _canvas(f"{session_index}-{run_index}-{time.time()}"),
+                                       use_cache=False)
+                queue_wait = sum(report.get("queue_wait_seconds", 0.0) for report in results["token_usage"].values())
+                queue_waits.append(queue_wait)
+                latencies.append(time.perf_counter() - started - queue_wait)
+            except Exception:
+                errors += 1
+        return latencies, queue_waits, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        outcomes = list(executor.map(session, range(sessions)))
+    wall_seconds = time.perf_counter() - started
+    latencies = [latency for session_latencies, _, _ in outcomes for latency in session_latencies]
+    queue_waits = [wait for _, session_waits, _ in outcomes for wait in session_waits]
+    errors = sum(session_errors for _, _, session_errors in outcomes)
+    return {
+        "sessions": sessions,
+        "runs": len(latencies) + errors,
+        "errors": errors,
+        "latency_seconds": summarize(latencies),
+        "queue_wait_seconds": summarize(queue_waits),
+        "throughput_runs_per_second": len(latencies) / wall_seconds if wall_seconds else None,
+        "wall_seconds": wall_seconds,
+    }
+
+
+# Python heap allocated by one pipeline run (tracemalloc peak)
+def bench_memory(runs):
+    peaks = []
+    for index in range(runs):
+        tracemalloc.start()
+        try:
+            run_pipeline(BENCH_API_KEY, _canvas(f"memory-{index}-{time.time()}"), use_cache=False)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        except Exception:
+            pass
+        finally:
+            tracemalloc.stop()
+    return {"peak_bytes_per_run": summarize(peaks)}
+
+
+class _CountingPlaceholder:
+    def __init__(self):
+        self.renders = 0
+        self.rendered_chars = 0
+        self.last = ""
+
+    def markdown(self, text):
+        self.renders += 1
+        self.rendered_chars += len(text)
+        self.last = text
+
+
+# Streamed rendering: full re-format per chunk vs the app's path, where the
+# worker feeds chunks into an EvaluationJob and the progress view takes a
+# snapshot every stream_refresh_interval()
+def bench_render(response_chars, chunk_size, chunk_interval):
+    text = (DEFAULT_RESPONSE_TEXT * (response_chars // len(DEFAULT_RESPONSE_TEXT) + 1))[:response_chars]
+    chunks = [text[start:start + chunk_size] for start in range(0, len(text), chunk_size)]
+
+    full = _CountingPlaceholder()
+    started = time.perf_counter()
+    response = ""
+    for chunk in chunks:
+        response += chunk
+        full.markdown(format_output(response))
+    full_seconds = time.perf_counter() - started
+
+    # Chunks arrive on a simulated clock so polls fall between them as with a live stream
+    polled = _CountingPlaceholder()
+    job = EvaluationJob("benchmark", BENCH_API_KEY, {})
+    refresh_interval = stream_refresh_interval()
+    clock = next_poll = 0.0
+    started = time.perf_counter()
+    for chunk in chunks:
+        clock += chunk_interval
+        job.add_chunk("initial_analysis", chunk)
+        if clock >= next_poll:
+            polled.markdown(job.snapshot()["partial"]["initial_analysis"])
+            next_poll = clock + refresh_interval
+    polled.markdown(job.snapshot()["partial"]["initial_analysis"])
+    polled_seconds = time.perf_counter() - started
+
+    return {
+        "chunks": len(chunks),
+        "full_reformat": {"cpu_seconds": full_seconds, "renders": full.renders,
+                          "rendered_chars": full.rendered_chars},
+        "job_snapshot": {"cpu_seconds": polled_seconds, "renders": polled.renders,
+                         "rendered_chars": polled.rendered_chars, "refresh_interval_seconds": refresh_interval},
+        "identical_output": polled.last == format_output(text),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to print p50 changes against an earlier results file
+def compare_results(previous, current, path=()):
+    for key, value in current.items():
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if isinstance(value, dict):
+            compare_results(old or {}, value, path + (key,))
+        elif key in ("p50", "throughput_runs_per_second", "cpu_seconds") and isinstance(old, (int, float)) and old:
+            change = (value - old) / old * 100
+            print(f"{'.'.join(path + (key,))}: {old:.4f} -> {value:.4f} ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation pipeline against a mock GROQ server")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file the results are written to")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--iterations", type=int, default=20, help="Sequential single completions")
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent sessions in the pipeline benchmark")
+    parser.add_argument("--runs-per-session", type=int, default=3)
+    parser.add_argument("--memory-runs", type=int, default=3)
+    parser.add_argument("--response-chars", type=int, default=4000)
+    parser.add_argument("--chunk-size", type=int, default=12)
+    parser.add_argument("--chunk-delay", type=float, default=0.002)
+    parser.add_argument("--ttft-delay", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests-per-minute", type=int, default=BENCH_REQUESTS_PER_MINUTE,
+                        help="Rate limiter request budget; lower it to benchmark throttling")
+    parser.add_argument("--tokens-per-minute", type=int, default=BENCH_TOKENS_PER_MINUTE,
+                        help="Rate limiter token budget; lower it to benchmark throttling")
+    args = parser.parse_args(argv)
+
+    config = MockGroqConfig(args.response_chars, args.chunk_size, args.chunk_delay, args.ttft_delay,
+                            args.error_rate, args.rate_limit_rate, retry_after=0, seed=args.seed)
+    server = start_mock_server(config)
+
+    # Keep benchmark state out of the app's cache, metrics and store files
+    workdir = tempfile.mkdtemp(prefix="bmc_benchmark_")
+    os.environ["GROQ_BASE_URL"] = server.base_url
+    os.environ["COMPLETION_CACHE_PATH"] = os.path.join(workdir, "completion_cache.sqlite3")
+    os.environ["METRICS_PROMETHEUS_FILE"] = os.path.join(workdir, "metrics.prom")
+    os.environ["GROQ_REQUESTS_PER_MINUTE"] = str(args.requests_per_minute)
+    os.environ["GROQ_TOKENS_PER_MINUTE"] = str(args.tokens_per_minute)
+
+    print(f"Mock GROQ server on {server.base_url}")
+    results = {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "results": {},
+    }
+    scenarios = [
+        ("completion", lambda: bench_completion(args.iterations)),
+        ("pipeline", lambda: bench_pipeline(args.sessions, args.runs_per_session)),
+        ("memory", lambda: bench_memory(args.memory_runs)),
+        ("render", lambda: bench_render(args.response_chars, args.chunk_size, args.chunk_delay)),
+    ]
+    for name, scenario in scenarios:
+        print(f"Running {name} benchmark...", flush=True)
+        results["results"][name] = scenario()
+    results["server"] = dict(config.stats)
+    server.shutdown()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["results"], indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f)
+        print(f"Compared with {args.compare} (commit {previous.get('commit')}):")
+        compare_results(previous.get("results", {}), results["results"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from app_logging import setup_logging
+from canvas_store import get_canvas_store
+from pipeline import CANVAS_COMPONENTS
+
+# Bulk export of saved evaluations to Parquet or XLSX, and import back.
+#
+#   python bulk_export.py export evaluations.parquet
+#   python bulk_export.py import evaluations.xlsx
+#
+# Runs are read from the canvas store and written in chunks, so memory stays
+# flat however many evaluations there are. Files are written under a temporary
+# name and renamed when complete; a failed export never leaves a partial file.
+
+DEFAULT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = (".parquet", ".xlsx")
+
+ANALYSIS_COLUMNS = ["initial_analysis", "critique", "optimization"]
+EXPORT_COLUMNS = (["id", "created_at", "canvas_hash"] + [key for key, _ in CANVAS_COMPONENTS]
+                  + ANALYSIS_COLUMNS + ["metadata", "source"])
+PARQUET_SCHEMA = pa.schema(
+    [("id", pa.int64()), ("created_at", pa.timestamp("us")), ("canvas_hash", pa.string())]
+    + [(column, pa.string()) for column in EXPORT_COLUMNS[3:]]
+)
+# Excel refuses cells longer than this; longer texts are cut off in XLSX exports
+XLSX_MAX_CELL_CHARS = 32767
+
+
+# Function to read all saved runs in chunks of flat export rows, oldest first
+def iter_export_chunks(store, chunk_size=DEFAULT_CHUNK_SIZE):
+    last_id = 0
+    while True:
+        runs = store.list_runs_after(last_id, limit=chunk_size)
+        if not runs:
+            return
+        rows = []
+        for run in runs:
+            row = {"id": run["id"], "created_at": run["created_at"], "canvas_hash": run["canvas_hash"]}
+            for key, _ in CANVAS_COMPONENTS:
+                row[key] = run["canvas"].get(key)
+            for column in ANALYSIS_COLUMNS:
+                row[column] = run[column]
+            row["metadata"] = json.dumps(run["metadata"])
+            # Rows without a source get one, so importing the file twice adds them once
+            row["source"] = run["source"] or f"canvas_store:{run['canvas_hash']}:{run['created_at'].timestamp()}"
+            rows.append(row)
+        yield rows
+        last_id = runs[-1]["id"]
+
+
+# Write through a temporary file in the target folder and rename it into place
+def _write_atomically(path, write):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False)
+    temp.close()
+    try:
+        count = write(temp.name)
+        os.replace(temp.name, path)
+        return count
+    except BaseException:
+        os.remove(temp.name)
+        raise
+
+
+# Writers return (evaluations written, cells changed to fit the format)
+def _write_parquet(chunks, temp_path):
+    count = 0
+    with pq.ParquetWriter(temp_path, PARQUET_SCHEMA, compression="zstd") as writer:
+        for rows in chunks:
+            # One row group per chunk
+            writer.write_table(pa.Table.from_pylist(rows, schema=PARQUET_SCHEMA))
+            count += len(rows)
+    return count, 0
+
+
+# Function to make a value storable in XLSX: control characters Excel rejects
+# are removed and texts over XLSX_MAX_CELL_CHARS are cut off
+def _xlsx_value(value):
+    if isinstance(value, str):
+        value = ILLEGAL_CHARACTERS_RE.sub("", value)
+        if len(value) > XLSX_MAX_CELL_CHARS:
+            value = value[:XLSX_MAX_CELL_CHARS]
+    return value
+
+
+def _write_xlsx(chunks, temp_path):
+    # Write-only workbooks stream rows to disk instead of keeping every cell in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("evaluations")
+    sheet.append(EXPORT_COLUMNS)
+    count = altered = 0
+    for rows in chunks:
+        for row in rows:
+            values = [_xlsx_value(row[column]) for column in EXPORT_COLUMNS]
+            altered += sum(1 for column, value in zip(EXPORT_COLUMNS, values) if value != row[column])
+            sheet.append(values)
+        count += len(rows)
+    workbook.save(temp_path)
+    return count, altered
+
+
+# Function to export every saved evaluation to a .parquet or .xlsx file.
+# Returns the number of evaluations written and the number of cells that had
+# to be shortened or cleaned to fit XLSX (always 0 for Parquet).
+def export_runs(path, store=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    store = store or get_canvas_store()
+    suffix = Path(path).suffix.lower()
+    if suffix not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{suffix}', use one of {', '.join(EXPORT_FORMATS)}")
+    write = _write_parquet if suffix == ".parquet" else _write_xlsx
+    count, altered = _write_atomically(path, lambda temp_path: write(iter_export_chunks(store, chunk_size), temp_path))
+    logging.info(f"Exported {count} evaluations to {path}")
+    if altered:
+        logging.warning(f"{altered} cells in {path} were shortened to {XLSX_MAX_CELL_CHARS} characters or had "
+                        "control characters removed; export to Parquet to keep them unchanged")
+    return count, altered
+
+
+def _iter_parquet_rows(path, chunk_size):
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        yield from batch.to_pylist()
+
+
+def _iter_xlsx_rows(path):
+    workbook = load_workbook(path, read_only=True)
+    try:
+        sheet_rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(sheet_rows, None)
+        if header is None:
+            return
+        for values in sheet_rows:
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def _row_to_run(row, path):
+    created_at = row.get("created_at")
+    if isinstance(created_at, datetime.datetime):
+        created_at = created_at.timestamp()
+    metadata = json.loads(row["metadata"]) if row.get("metadata") else {}
+    metadata.setdefault("imported_from", Path(path).name)
+    return {
+        "business_model_data": {key: row.get(key) or "" for key, _ in CANVAS_COMPONENTS},
+        "initial_analysis": row.get("initial_analysis"),
+        "critique": row.get("critique"),
+        "optimization": row.get("optimization"),
+        "metadata": metadata,
+        "source": row.get("source"),
+        "created_at": created_at,
+        # Empty fields do not survive XLSX, so duplicates are matched on the exported hash
+        "canvas_hash": row.get("canvas_hash"),
+    }
+
+
+# Function to import evaluations from a .parquet or .xlsx export into the canvas
+# store, one transaction per chunk. Rows imported before are skipped.
+# Returns the number of evaluations added.
+def import_runs(path, store=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    store = store or get_canvas_store()
+    suffix = Path(path).suffix.lower()
+    if suffix == ".parquet":
+        rows = _iter_parquet_rows(path, chunk_size)
+    elif suffix == ".xlsx":
+        rows = _iter_xlsx_rows(path)
+    else:
+        raise ValueError(f"Unsupported import format '{suffix}', use one of {', '.join(EXPORT_FORMATS)}")
+
+    imported = 0
+    chunk = []
+    for row in rows:
+        chunk.append(_row_to_run(row, path))
+        if len(chunk) >= chunk_size:
+            imported += store.save_runs(chunk)
+            chunk = []
+    if chunk:
+        imported += store.save_runs(chunk)
+    logging.info(f"Imported {imported} evaluations from {path}")
+    return imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export saved evaluations to Parquet/XLSX or import them back")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("path", help="File to write or read; the format follows the .parquet or .xlsx extension")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Evaluations read and written per chunk")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    setup_logging()
+
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    try:
+        if args.action == "export":
+            count, altered = export_runs(args.path, chunk_size=args.chunk_size)
+            print(f"Exported {count} evaluations to {args.path}")
+            if altered:
+                print(f"Warning: {altered} cells were shortened or cleaned to fit XLSX; "
+                      "use .parquet for a lossless export")
+        else:
+            count = import_runs(args.path, chunk_size=args.chunk_size)
+            print(f"Imported {count} evaluations from {args.path}")
+    except (OSError, ValueError) as e:
+        logging.error(f"Bulk {args.action} failed: {str(e)}")
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from canvas_store import get_canvas_store
+from pipeline import CANVAS_COMPONENTS
+
+DEFAULT_INDEX_DIR = 'canvas_index'
+DEFAULT_DIMENSIONS = 1024
+DEFAULT_REUSE_THRESHOLD = 0.92
+
+ANALYSIS_FIELDS = ("initial_analysis", "critique", "optimization")
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+# Function to list the hashed features of a text: its words and word pairs,
+# optionally prefixed so the same word in two canvas fields stays distinct
+def _features(text, prefix=""):
+    words = _WORD_PATTERN.findall((text or "").lower())
+    features = [prefix + word for word in words]
+    features += [f"{prefix}{first} {second}" for first, second in zip(words, words[1:])]
+    return features
+
+
+# Function to embed features with the hashing trick: each feature adds +1 or -1
+# to one of `dimensions` buckets, then the vector is L2-normalized so inner
+# product is cosine similarity. Runs locally with no model download.
+def _embed(features, dimensions):
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'little')
+        vector[value % dimensions] += 1.0 if value >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+# Function to embed a canvas for near-duplicate detection; the wording of each
+# field counts, so small edits keep a high similarity
+def embed_canvas(business_model_data, dimensions=DEFAULT_DIMENSIONS):
+    features = []
+    for field, _ in CANVAS_COMPONENTS:
+        features += _features(business_model_data.get(field), prefix=f"{field}:")
+    return _embed(features, dimensions)
+
+
+# Function to embed free text (a search query, or a canvas with its analyses)
+def embed_text(text, dimensions=DEFAULT_DIMENSIONS):
+    return _embed(_features(text), dimensions)
+
+
+def _run_text(run):
+    parts = [run["canvas"].get(field) or "" for field, _ in CANVAS_COMPONENTS]
+    parts += [run.get(field) or "" for field in ANALYSIS_FIELDS]
+    return "\n".join(parts)
+
+
+# FAISS indexes over the runs in the canvas store, kept on disk next to it.
+# "canvas" holds one vector per stored canvas for near-duplicate lookups,
+# "content" one per canvas plus its analyses for free-text retrieval.
+# Vectors are keyed by run id; new runs are picked up incrementally by reading
+# the store from the highest indexed id onwards.
+class CanvasIndex:
+    def __init__(self, store, index_dir=DEFAULT_INDEX_DIR, dimensions=DEFAULT_DIMENSIONS):
+        self.store = store
+        self.index_dir = Path(index_dir)
+        self.dimensions = dimensions
+        self.last_run_id = 0
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _new_index(self):
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimensions))
+
+    def _load(self):
+        state_path = self.index_dir / "state.json"
+        try:
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+            if state.get("dimensions") != self.dimensions:
+                raise ValueError(f"index has {state.get('dimensions')} dimensions, expected {self.dimensions}")
+            indexes = {name: faiss.read_index(str(self.index_dir / f"{name}.faiss")) for name in ("canvas", "content")}
+            self._indexes = indexes
+            self.last_run_id = state["last_run_id"]
+            logging.info(f"Loaded canvas index with {indexes['canvas'].ntotal} canvases from {self.index_dir}")
+        except FileNotFoundError:
+            self._indexes = {"canvas": self._new_index(), "content": self._new_index()}
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            # An unreadable index is rebuilt from the store on the next sync
+            logging.error(f"Could not load canvas index, rebuilding it: {str(e)}")
+            self._indexes = {"canvas": self._new_index(), "content": self._new_index()}
+            self.last_run_id = 0
+
+    # Write each file to a temporary name and rename, so a crash never leaves a partial index
+    def _save(self):
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        for name, index in self._indexes.items():
+            temp_path = self.index_dir / f"{name}.faiss.tmp"
+            faiss.write_index(index, str(temp_path))
+            os.replace(temp_path, self.index_dir / f"{name}.faiss")
+        temp_path = self.index_dir / "state.json.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"dimensions": self.dimensions, "last_run_id": self.last_run_id}, f)
+        os.replace(temp_path, self.index_dir / "state.json")
+
+    # Function to add the runs saved since the last sync. Returns how many were added.
+    def sync(self):
+        with self._lock:
+            added = 0
+            while True:
+                runs = self.store.list_runs_after(self.last_run_id)
+                if not runs:
+                    break
+                ids = np.array([run["id"] for run in runs], dtype=np.int64)
+                canvases = np.stack([embed_canvas(run["canvas"], self.dimensions) for run in runs])
+                contents = np.stack([embed_text(_run_text(run), self.dimensions) for run in runs])
+                self._indexes["canvas"].add_with_ids(canvases, ids)
+                self._indexes["content"].add_with_ids(contents, ids)
+                self.last_run_id = int(ids[-1])
+                added += len(runs)
+            if added:
+                try:
+                    self._save()
+                except (OSError, RuntimeError) as e:
+                    logging.error(f"Could not save canvas index: {str(e)}")
+                logging.info(f"Added {added} runs to the canvas index")
+            return added
+
+    def _search(self, name, vector, limit):
+        if not vector.any():
+            return []
+        with self._lock:
+            index = self._indexes[name]
+            if index.ntotal == 0:
+                return []
+            scores, ids = index.search(vector.reshape(1, -1), min(limit, index.ntotal))
+        return [(int(run_id), float(score)) for run_id, score in zip(ids[0], scores[0]) if run_id != -1]
+
+    # Function to find stored runs whose canvas is most similar to this one.
+    # Returns (run_id, similarity) pairs, most similar first; 1.0 is identical wording.
+    def similar_canvases(self, business_model_data, limit=5):
+        self.sync()
+        return self._search("canvas", embed_canvas(business_model_data, self.dimensions), limit)
+
+    # Function to search canvases and analyses by free text
+    def search(self, text, limit=10):
+        self.sync()
+        return self._search("content", embed_text(text, self.dimensions), limit)
+
+    # Function to find the most similar stored run with a complete evaluation
+    # at or above the threshold. Returns (run, similarity) or None.
+    def find_reusable_run(self, business_model_data, threshold=DEFAULT_REUSE_THRESHOLD):
+        for run_id, similarity in self.similar_canvases(business_model_data):
+            if similarity < threshold:
+                break
+            run = self.store.get_run(run_id)
+            # Deleted runs stay in the index until it is rebuilt
+            if run is not None and all(run[field] for field in ANALYSIS_FIELDS):
+                return run, similarity
+        return None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+# Process-wide index over the process-wide canvas store
+def get_canvas_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CanvasIndex(
+                get_canvas_store(),
+                index_dir=os.getenv('CANVAS_INDEX_DIR', DEFAULT_INDEX_DIR),
+                dimensions=int(os.getenv('CANVAS_INDEX_DIMENSIONS', DEFAULT_DIMENSIONS))
+            )
+        return _index
+
+
+# Similarity above which a new canvas is offered a stored evaluation
+def get_reuse_threshold():
+    return float(os.getenv('CANVAS_REUSE_THRESHOLD', DEFAULT_REUSE_THRESHOLD))
@@ -0,0 +1,247 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_STORE_PATH = 'canvas_store.sqlite3'
+
+_FLAT_FILE_PATTERN = re.compile(r'^business_plan_(\d{8}_\d{6})\.json$')
+_ANALYSIS_SECTIONS = re.compile(
+    r'Initial Analysis:\n(?P<initial_analysis>.*?)\n\n'
+    r'Critical Analysis:\n(?P<critique>.*?)\n\n'
+    r'Optimized Business Model:\n(?P<optimization>.*?)\n?$',
+    re.DOTALL
+)
+_EMPTY_ANALYSIS = {
+    'No analysis generated yet', 'No critique generated yet', 'No optimization generated yet'
+}
+
+
+# Function to hash a canvas so identical canvases can be found again
+def canvas_hash(business_model_data):
+    canonical = json.dumps(business_model_data, sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+# Turn free text into an FTS5 query that matches all of its words
+def _fts_query(text):
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    return " ".join(terms)
+
+
+# Persistent store of canvases, their three analysis stages and run metadata.
+# Every evaluation is a row in `runs`, indexed by time and canvas hash, and the
+# analyses are full-text searchable through an FTS5 table kept in sync by triggers.
+class CanvasStore:
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._init_db()
+
+    # Short-lived connection per operation: commits on success, always closes
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA busy_timeout = 30000")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    canvas_hash TEXT NOT NULL,
+                    canvas_json TEXT NOT NULL,
+                    initial_analysis TEXT,
+                    critique TEXT,
+                    optimization TEXT,
+                    metadata TEXT NOT NULL DEFAULT '{}',
+                    source TEXT,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_runs_created_at ON runs (created_at);
+                CREATE INDEX IF NOT EXISTS idx_runs_canvas_hash ON runs (canvas_hash);
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_runs_source ON runs (source);
+
+                CREATE VIRTUAL TABLE IF NOT EXISTS runs_fts USING fts5(
+                    canvas_json, initial_analysis, critique, optimization,
+                    content='runs', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS runs_ai AFTER INSERT ON runs BEGIN
+                    INSERT INTO runs_fts (rowid, canvas_json, initial_analysis, critique, optimization)
+                    VALUES (new.id, new.canvas_json, new.initial_analysis, new.critique, new.optimization);
+                END;
+                CREATE TRIGGER IF NOT EXISTS runs_ad AFTER DELETE ON runs BEGIN
+                    INSERT INTO runs_fts (runs_fts, rowid, canvas_json, initial_analysis, critique, optimization)
+                    VALUES ('delete', old.id, old.canvas_json, old.initial_analysis, old.critique, old.optimization);
+                END;
+            """)
+
+    # Save one evaluation run and return its id
+    def save_run(self, business_model_data, initial_analysis=None, critique=None, optimization=None,
+                 metadata=None, source=None, created_at=None):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (canvas_hash, canvas_json, initial_analysis, critique, optimization, "
+                "metadata, source, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (canvas_hash(business_model_data), json.dumps(business_model_data, indent=2),
+                 initial_analysis, critique, optimization, json.dumps(metadata or {}), source,
+                 created_at if created_at is not None else time.time())
+            )
+            run_id = cursor.lastrowid
+        logging.info(f"Saved evaluation run {run_id} to canvas store")
+        return run_id
+
+    # Save many runs in one transaction. Each run is a dict with the save_run
+    # arguments. Runs whose source was saved before, or that repeat a stored run
+    # (same canvas saved at the same time), are skipped. An optional
+    # "canvas_hash" names the stored canvas the run was exported from.
+    # Returns the number of runs inserted.
+    def save_runs(self, runs):
+        rows = []
+        for run in runs:
+            run_hash = canvas_hash(run["business_model_data"])
+            created_at = run["created_at"] if run.get("created_at") is not None else time.time()
+            rows.append((
+                run_hash, json.dumps(run["business_model_data"], indent=2),
+                run.get("initial_analysis"), run.get("critique"), run.get("optimization"),
+                json.dumps(run.get("metadata") or {}), run.get("source"), created_at,
+                run.get("canvas_hash") or run_hash, created_at
+            ))
+        with self._connect() as conn:
+            # Connection change counters include the FTS trigger writes, so count new ids instead
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM runs").fetchone()[0]
+            conn.executemany(
+                "INSERT OR IGNORE INTO runs (canvas_hash, canvas_json, initial_analysis, critique, optimization, "
+                "metadata, source, created_at) SELECT ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS ("
+                "SELECT 1 FROM runs WHERE canvas_hash = ? AND ABS(created_at - ?) < 0.001)",
+                rows
+            )
+            inserted = conn.execute("SELECT COUNT(*) FROM runs WHERE id > ?", (last_id,)).fetchone()[0]
+        return inserted
+
+    def _row_to_run(self, row):
+        run = dict(row)
+        run["canvas"] = json.loads(run.pop("canvas_json"))
+        run["metadata"] = json.loads(run["metadata"])
+        run["created_at"] = datetime.datetime.fromtimestamp(run["created_at"])
+        return run
+
+    # Function to load a full run by id, or None
+    def get_run(self, run_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return self._row_to_run(row) if row else None
+
+    # Function to find the runs for a canvas, newest first
+    def find_by_canvas(self, business_model_data, limit=10):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM runs WHERE canvas_hash = ? ORDER BY created_at DESC LIMIT ?",
+                (canvas_hash(business_model_data), limit)
+            ).fetchall()
+        return [self._row_to_run(row) for row in rows]
+
+    # Function to list one page of runs, newest first, optionally full-text filtered.
+    # Returns lightweight summaries and the total number of matching runs.
+    def list_runs(self, query=None, page=0, page_size=20):
+        columns = ("runs.id, runs.canvas_hash, runs.created_at, "
+                   "json_extract(runs.canvas_json, '$.value_proposition') AS value_proposition")
+        with self._connect() as conn:
+            if query and query.strip():
+                match = _fts_query(query)
+                total = conn.execute(
+                    "SELECT COUNT(*) FROM runs_fts WHERE runs_fts MATCH ?", (match,)
+                ).fetchone()[0]
+                rows = conn.execute(
+                    f"SELECT {columns} FROM runs_fts JOIN runs ON runs.id = runs_fts.rowid "
+                    "WHERE runs_fts MATCH ? ORDER BY runs.created_at DESC LIMIT ? OFFSET ?",
+                    (match, page_size, page * page_size)
+                ).fetchall()
+            else:
+                total = conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+                rows = conn.execute(
+                    f"SELECT {columns} FROM runs ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                    (page_size, page * page_size)
+                ).fetchall()
+        summaries = []
+        for row in rows:
+            summary = dict(row)
+            summary["created_at"] = datetime.datetime.fromtimestamp(summary["created_at"])
+            summaries.append(summary)
+        return summaries, total
+
+    # Function to read full runs with an id above after_id, oldest first,
+    # so consumers can pick up new runs incrementally
+    def list_runs_after(self, after_id=0, limit=500):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM runs WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)
+            ).fetchall()
+        return [self._row_to_run(row) for row in rows]
+
+    def delete_run(self, run_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+
+    # One-time importer for business_plan_YYYYMMDD_HHMMSS.json/.txt files written
+    # by the DATA tab. Files already imported are skipped, so it is safe to re-run.
+    def import_flat_files(self, folder_path):
+        imported = 0
+        for json_path in sorted(Path(folder_path).glob("business_plan_*.json")):
+            match = _FLAT_FILE_PATTERN.match(json_path.name)
+            if not match:
+                continue
+            source = str(json_path.resolve())
+            try:
+                with open(json_path, 'r') as f:
+                    business_model_data = json.load(f)
+                analyses = self._read_flat_analysis(json_path.with_suffix('.txt'))
+                created_at = datetime.datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+                self.save_run(business_model_data, metadata={"imported_from": json_path.name},
+                              source=source, created_at=created_at, **analyses)
+                imported += 1
+            except sqlite3.IntegrityError:
+                # Unique source index: this file was imported before
+                continue
+            except (OSError, ValueError) as e:
+                logging.error(f"Could not import {json_path}: {str(e)}")
+        logging.info(f"Imported {imported} business plan files from {folder_path}")
+        return imported
+
+    def _read_flat_analysis(self, txt_path):
+        if not txt_path.exists():
+            return {}
+        with open(txt_path, 'r') as f:
+            content = f.read()
+        _, _, analysis_text = content.partition("=== BUSINESS MODEL CANVAS ANALYSIS ===\n\n")
+        match = _ANALYSIS_SECTIONS.search(analysis_text)
+        if not match:
+            return {}
+        return {key: (value if value not in _EMPTY_ANALYSIS else None)
+                for key, value in match.groupdict().items()}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Process-wide store instance shared by all sessions
+def get_canvas_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CanvasStore(os.getenv('CANVAS_STORE_PATH', DEFAULT_STORE_PATH))
+        return _store
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Default location and limits
+DEFAULT_CACHE_PATH = 'completion_cache.sqlite3'
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 2000
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+
+# Disk-backed cache of GROQ completions.
+# SQLite in WAL mode lets every Streamlit session and worker process share the
+# same file; entries expire after a TTL and the least recently used ones are
+# evicted once the entry count or total size goes over the cap.
+class CompletionCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._init_db()
+
+    # Short-lived connection per operation: commits on success, always closes
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA busy_timeout = 30000")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_last_accessed "
+                         "ON completions (last_accessed)")
+
+    # Build the cache key from everything that influences the completion
+    @staticmethod
+    def make_key(model, system_prompt, prompt, **params):
+        payload = json.dumps({
+            "model": model,
+            "system_prompt": system_prompt,
+            "prompt": prompt,
+            "params": params,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    # Return the cached response or None; a hit refreshes its LRU position
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[1] if entry is not None else None
+
+    # Return (model that produced the response, response) or None
+    def get_entry(self, key):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT model, response, created_at FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                model, response, created_at = row
+                if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                    conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    return None
+                conn.execute("UPDATE completions SET last_accessed = ? WHERE key = ?", (now, key))
+                return model, response
+        except sqlite3.Error as e:
+            logging.error(f"Completion cache read failed: {str(e)}")
+            return None
+
+    # Store a finished completion and enforce the size cap
+    def put(self, key, model, response):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO completions "
+                    "(key, model, response, size, created_at, last_accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, response, len(response.encode('utf-8')), now, now)
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logging.error(f"Completion cache write failed: {str(e)}")
+
+    def _evict(self, conn, now):
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM completions WHERE created_at < ?", (now - self.ttl_seconds,))
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Walk from least to most recently used until we are back under both caps
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM completions ORDER BY last_accessed ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM completions WHERE key = ?", doomed)
+        logging.info(f"Evicted {len(doomed)} entries from completion cache")
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM completions")
+
+    def stats(self):
+        with self._connect() as conn:
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions"
+            ).fetchone()
+        return {"entries": count, "bytes": total}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Process-wide cache instance shared by all sessions.
+# Limits can be overridden through the environment (.env).
+def get_completion_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CompletionCache(
+                path=os.getenv('COMPLETION_CACHE_PATH', DEFAULT_CACHE_PATH),
+                ttl_seconds=int(os.getenv('COMPLETION_CACHE_TTL', DEFAULT_TTL_SECONDS)),
+                max_entries=int(os.getenv('COMPLETION_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+                max_bytes=int(os.getenv('COMPLETION_CACHE_MAX_MB', DEFAULT_MAX_BYTES // (1024 * 1024))) * 1024 * 1024
+            )
+        return _cache
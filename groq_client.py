@@ -0,0 +1,110 @@
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import httpx
+from groq import AuthenticationError, Groq, PermissionDeniedError
+
+# Connection settings, overridable through the environment (.env)
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE = 10
+DEFAULT_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_VALIDATION_TTL = 15 * 60
+
+_clients = {}
+_clients_lock = threading.Lock()
+_validations = {}
+_validations_lock = threading.Lock()
+
+
+# Never keep raw API keys as dictionary keys or in logs
+def _fingerprint(api_key):
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+def _build_client(api_key):
+    timeout = httpx.Timeout(
+        float(os.getenv('GROQ_TIMEOUT', DEFAULT_TIMEOUT)),
+        connect=float(os.getenv('GROQ_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT))
+    )
+    limits = httpx.Limits(
+        max_connections=int(os.getenv('GROQ_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS)),
+        max_keepalive_connections=int(os.getenv('GROQ_MAX_KEEPALIVE', DEFAULT_MAX_KEEPALIVE)),
+        keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY
+    )
+    http_client = httpx.Client(timeout=timeout, limits=limits)
+    # Completions are retried by generate_completion through the shared rate
+    # limiter, which needs to see every 429, so the SDK does not retry on its own
+    return Groq(api_key=api_key, timeout=timeout, http_client=http_client, max_retries=0)
+
+
+# Process-wide registry: one pooled, keep-alive client per API key,
+# shared by every Streamlit session and worker thread
+def get_groq_client(api_key):
+    fingerprint = _fingerprint(api_key)
+    with _clients_lock:
+        client = _clients.get(fingerprint)
+        if client is None:
+            client = _build_client(api_key)
+            _clients[fingerprint] = client
+            logging.info("Created pooled GROQ client")
+        return client
+
+
+# Close and forget the client for one key (e.g. after it was rejected)
+def close_groq_client(api_key):
+    with _clients_lock:
+        client = _clients.pop(_fingerprint(api_key), None)
+    if client is not None:
+        client.close()
+
+
+def close_groq_clients():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logging.error(f"Error closing GROQ client: {str(e)}")
+
+
+atexit.register(close_groq_clients)
+
+
+# Function to validate GROQ API key.
+# Listing models is free, unlike a completion, and the verdict is cached for a
+# TTL so reruns and repeated clicks do not go back to the network.
+# Network failures are not cached, only a definite accept or reject.
+def validate_groq_api_key(api_key, ttl_seconds=None):
+    if ttl_seconds is None:
+        ttl_seconds = int(os.getenv('GROQ_VALIDATION_TTL', DEFAULT_VALIDATION_TTL))
+    fingerprint = _fingerprint(api_key)
+    now = time.time()
+    with _validations_lock:
+        cached = _validations.get(fingerprint)
+    if cached is not None and now - cached[1] < ttl_seconds:
+        logging.info("API key validation served from cache")
+        return cached[0]
+
+    try:
+        get_groq_client(api_key).models.list()
+        is_valid = True
+        logging.info("API key validation successful")
+    except (AuthenticationError, PermissionDeniedError) as e:
+        is_valid = False
+        close_groq_client(api_key)
+        logging.error(f"API key validation failed: {str(e)}")
+    except Exception as e:
+        logging.error(f"API key validation failed: {str(e)}")
+        return False
+
+    with _validations_lock:
+        _validations[fingerprint] = (is_valid, now)
+    return is_valid
@@ -0,0 +1,257 @@
+import collections
+import logging
+import os
+import threading
+import time
+import uuid
+
+from canvas_store import get_canvas_store
+from pipeline import run_pipeline
+from stream_renderer import IncrementalFormatter
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUE_DEPTH = 50
+DEFAULT_MAX_JOBS_PER_USER = 2
+DEFAULT_RESULT_TTL = 3600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+# One evaluation submitted to the job queue.
+# The worker thread appends streamed text and step results while the UI reads
+# snapshots, so all state changes go through the job's lock.
+# Streamed text is formatted as it arrives, so a snapshot only joins what was
+# formatted since the last one instead of formatting the whole text again.
+class EvaluationJob:
+    def __init__(self, user_id, api_key, business_model_data, use_cache=True, fan_out=False, memo=None,
+                 structured=False, previous=None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.api_key = api_key
+        self.business_model_data = business_model_data
+        self.use_cache = use_cache
+        self.fan_out = fan_out
+        self.structured = structured
+        # Earlier evaluation to refresh incrementally (see run_pipeline)
+        self.previous = previous
+        self.memo = dict(memo or {})
+        self.status = QUEUED
+        self.error = None
+        self.results = None
+        self.run_id = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._partial = collections.defaultdict(IncrementalFormatter)
+        # Streamed sections per step: parallel Step 1 analyses and structured output
+        self._components = collections.defaultdict(lambda: collections.defaultdict(IncrementalFormatter))
+        self._outputs = {}
+        self._finished_steps = {}
+        self._lock = threading.Lock()
+
+    def add_chunk(self, step, delta, component=None):
+        with self._lock:
+            if component is None:
+                self._partial[step].feed(delta)
+            else:
+                self._components[step][component].feed(delta)
+
+    # Drop the text streamed for a step that is about to be run again
+    def reset_step(self, step):
+        with self._lock:
+            self._partial.pop(step, None)
+            self._components.pop(step, None)
+
+    def finish_step(self, step, output, reused, token_report, sections=None, refreshed=None):
+        with self._lock:
+            if output is not None:
+                self._outputs[step] = output
+            self._finished_steps[step] = {"reused": reused, "token_report": token_report, "sections": sections,
+                                          "refreshed": refreshed}
+
+    def _set(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    # Consistent copy of the job's progress for rendering; partial and
+    # components hold the streamed text already formatted
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "error": self.error,
+                "fan_out": self.fan_out,
+                "partial": {step: formatter.text() for step, formatter in self._partial.items()},
+                "components": {step: {key: formatter.text() for key, formatter in components.items()}
+                               for step, components in self._components.items()},
+                "outputs": dict(self._outputs),
+                "finished_steps": dict(self._finished_steps),
+                "results": self.results,
+                "memo": dict(self.memo),
+                "run_id": self.run_id,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+# Shared pool of worker threads running evaluations for every session.
+# Pending jobs are kept per user and workers take them round-robin across
+# users, so one user submitting many canvases cannot starve the others.
+# The total queue depth and each user's number of unfinished jobs are capped.
+class JobQueue:
+    def __init__(self, workers=DEFAULT_WORKERS, max_queue_depth=DEFAULT_MAX_QUEUE_DEPTH,
+                 max_jobs_per_user=DEFAULT_MAX_JOBS_PER_USER, result_ttl=DEFAULT_RESULT_TTL):
+        self.max_queue_depth = max_queue_depth
+        self.max_jobs_per_user = max_jobs_per_user
+        self.result_ttl = result_ttl
+        self._pending = collections.OrderedDict()
+        self._queued_count = 0
+        self._unfinished_per_user = collections.Counter()
+        self._jobs = {}
+        self._condition = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"evaluation-worker-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, user_id, api_key, business_model_data, use_cache=True, fan_out=False, memo=None,
+               structured=False, previous=None):
+        with self._condition:
+            self._prune_finished()
+            if self._queued_count >= self.max_queue_depth:
+                raise JobQueueFull("The evaluation queue is full. Please try again in a moment.")
+            if self._unfinished_per_user[user_id] >= self.max_jobs_per_user:
+                raise JobQueueFull(f"You already have {self._unfinished_per_user[user_id]} evaluations in progress. "
+                                   "Please wait for one to finish.")
+            job = EvaluationJob(user_id, api_key, business_model_data, use_cache, fan_out, memo, structured, previous)
+            self._jobs[job.id] = job
+            self._pending.setdefault(user_id, collections.deque()).append(job)
+            self._queued_count += 1
+            self._unfinished_per_user[user_id] += 1
+            self._condition.notify()
+        logging.info(f"Queued evaluation job {job.id} ({self._queued_count} waiting)")
+        return job
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    # Forget a finished job once its session has collected the results
+    def discard(self, job_id):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished_at is not None:
+                del self._jobs[job_id]
+
+    # Number of queued jobs a worker will take before this one (round-robin order)
+    def position(self, job_id):
+        with self._condition:
+            lanes = [list(jobs) for jobs in self._pending.values()]
+        ahead = 0
+        for depth in range(max((len(lane) for lane in lanes), default=0)):
+            for lane in lanes:
+                if depth < len(lane):
+                    if lane[depth].id == job_id:
+                        return ahead
+                    ahead += 1
+        return None
+
+    def stats(self):
+        with self._condition:
+            running = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+            return {"queued": self._queued_count, "running": running, "workers": len(self._workers),
+                    "users_waiting": len(self._pending)}
+
+    def _next_job(self):
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            user_id, jobs = self._pending.popitem(last=False)
+            job = jobs.popleft()
+            if jobs:
+                # Back of the line for this user's remaining jobs
+                self._pending[user_id] = jobs
+            self._queued_count -= 1
+            return job
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            try:
+                self._run(job)
+            finally:
+                with self._condition:
+                    self._unfinished_per_user[job.user_id] -= 1
+                    if self._unfinished_per_user[job.user_id] <= 0:
+                        del self._unfinished_per_user[job.user_id]
+
+    def _run(self, job):
+        job._set(status=RUNNING, started_at=time.time())
+        try:
+            results = run_pipeline(job.api_key, job.business_model_data, use_cache=job.use_cache,
+                                   fan_out=job.fan_out, memo=job.memo,
+                                   on_chunk=job.add_chunk, on_step=job.finish_step, structured=job.structured,
+                                   previous=job.previous, on_reset=job.reset_step)
+            run_id = get_canvas_store().save_run(
+                job.business_model_data,
+                initial_analysis=results["initial_analysis"],
+                critique=results["critique"],
+                optimization=results["optimization"],
+                metadata={
+                    "models": results["models"],
+                    "bypass_cache": not job.use_cache,
+                    "parallel_components": job.fan_out,
+                    "structured_output": job.structured,
+                    "refreshed_sections": results["refreshed"],
+                    "previous_run_id": (job.previous or {}).get("run_id"),
+                    "token_usage": results["token_usage"],
+                    "duration_seconds": round(time.time() - job.started_at, 3),
+                    "queue_wait_seconds": round(job.started_at - job.created_at, 3),
+                }
+            )
+            job._set(status=DONE, results=results, run_id=run_id, finished_at=time.time())
+            logging.info("Successfully completed business model evaluation")
+        except Exception as e:
+            error_msg = f"Error during business model evaluation: {str(e)}"
+            logging.error(error_msg)
+            job._set(status=FAILED, error=error_msg, finished_at=time.time())
+        finally:
+            # The key is only needed while the job runs
+            job.api_key = None
+
+    # Forget finished jobs nobody has collected within the TTL
+    def _prune_finished(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+# Process-wide job queue shared by all sessions
+def get_job_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(
+                workers=int(os.getenv('EVALUATION_WORKERS', DEFAULT_WORKERS)),
+                max_queue_depth=int(os.getenv('EVALUATION_QUEUE_DEPTH', DEFAULT_MAX_QUEUE_DEPTH)),
+                max_jobs_per_user=int(os.getenv('EVALUATION_MAX_JOBS_PER_USER', DEFAULT_MAX_JOBS_PER_USER))
+            )
+        return _queue
@@ -1,53 +1,103 @@
-from groq import Groq
 import streamlit as st
 import os
-import tempfile
 import json
-import requests
-import pandas as pd
 import datetime
 import time
 import logging
+import uuid
 from dotenv import load_dotenv
 from pathlib import Path
-
-# Configure logging
-logging.basicConfig(
-    filename='log.txt',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Initialize session state for storing analysis results
-if 'initial_analysis' not in st.session_state:
-    st.session_state.initial_analysis = None
-if 'critique' not in st.session_state:
-    st.session_state.critique = None
-if 'optimization' not in st.session_state:
-    st.session_state.optimization = None
-
-# Function to validate GROQ API key
-def validate_groq_api_key(api_key):
-    try:
-        client = Groq(api_key=api_key)
-        completion = client.chat.completions.create(
-            model="llama3-8b-8192",
-            messages=[{"role": "user", "content": "Hello"}],
-            max_tokens=10,
-            stream=False
-        )
-        logging.info("API key validation successful")
-        return True
-    except Exception as e:
-        logging.error(f"API key validation failed: {str(e)}")
-        return False
-
-# Read the README file
+from app_logging import LOG_LEVELS, read_log_page, setup_logging
+from bulk_export import EXPORT_FORMATS, export_runs, import_runs
+from canvas_index import get_canvas_index, get_reuse_threshold
+from canvas_store import canvas_hash, get_canvas_store
+from groq_client import validate_groq_api_key
+from job_queue import DONE, FAILED, QUEUED, JobQueueFull, get_job_queue
+from metrics import get_metrics
+from pipeline import (CANVAS_COMPONENTS, affected_components, changed_components, has_complete_sections,
+                      split_component_analyses)
+from rate_limiter import rate_limiter_stats
+from session_store import get_session_store, is_valid_session_id, session_store_stats
+from stream_renderer import format_output, stream_refresh_interval
+
+# One-time process setup, not repeated on every rerun
+@st.cache_resource
+def init_app():
+    # Load environment variables from .env file
+    load_dotenv()
+    # Configure logging (queued, rotating log.txt)
+    setup_logging()
+
+init_app()
+script_run_started = time.process_time()
+
+# Each browser session counts as one user for the job queue's fairness limits.
+# Its analysis results and step memo are kept in the session store under this
+# ID (see get_evaluation below), not in st.session_state. The ID is also kept in
+# the URL, so a user who reloads or comes back later gets their results back.
+if 'user_id' not in st.session_state:
+    returning_user_id = st.query_params.get("session")
+    st.session_state.user_id = returning_user_id if is_valid_session_id(returning_user_id) else uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.user_id
+
+# Evaluations run on the shared job queue; the session only keeps the job ID
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+
+# A canvas loaded from the store is applied before the input widgets are created
+if 'loaded_canvas' in st.session_state:
+    for component, _ in CANVAS_COMPONENTS:
+        st.session_state[component] = st.session_state.loaded_canvas.get(component, '')
+    del st.session_state.loaded_canvas
+
+# Evaluation shown when the session has none yet
+EMPTY_EVALUATION = {"initial_analysis": None, "critique": None, "optimization": None, "finished_steps": {}}
+
+# Function to read the session's evaluation: the output of each step and the
+# details of the finished steps, read back from disk if the session was idle
+def get_evaluation():
+    return get_session_store().get(st.session_state.user_id, "evaluation") or EMPTY_EVALUATION
+
+# Function to replace the session's evaluation
+def set_evaluation(initial_analysis, critique, optimization, finished_steps=None):
+    get_session_store().put(st.session_state.user_id, "evaluation", {
+        "initial_analysis": initial_analysis,
+        "critique": critique,
+        "optimization": optimization,
+        "finished_steps": finished_steps or {},
+    })
+
+# Outputs of completed pipeline steps, keyed by a hash of their inputs
+def get_step_memo():
+    return get_session_store().get(st.session_state.user_id, "step_memo") or {}
+
+# The canvas the session's evaluation belongs to and the sections of each step,
+# so a re-run after editing a few fields only refreshes what changed
+def get_evaluated_canvas():
+    return get_session_store().get(st.session_state.user_id, "evaluated_canvas")
+
+def set_evaluated_canvas(business_model_data, sections, run_id=None):
+    get_session_store().put(st.session_state.user_id, "evaluated_canvas", {
+        "business_model_data": business_model_data,
+        "sections": sections,
+        "run_id": run_id,
+    })
+
+# Function to show a stored evaluation in this session; its canvas becomes
+# the one later edits are compared against
+def use_stored_run(stored_run):
+    set_evaluation(stored_run["initial_analysis"], stored_run["critique"], stored_run["optimization"])
+    set_evaluated_canvas(stored_run["canvas"],
+                         {step: split_component_analyses(stored_run[step]) for step, _ in EVALUATION_STEPS},
+                         stored_run["id"])
+    st.session_state.run_id = stored_run["id"]
+
+# Read the README file (cached until the file changes)
 def read_readme():
+    return _read_readme_cached(os.path.getmtime('readme.md'))
+
+@st.cache_data
+def _read_readme_cached(modified_time):
     with open('readme.md', 'r') as file:
         return file.read()
 
@@ -55,6 +105,10 @@ def read_readme():
 def create_business_model_json(data_dict):
     return json.dumps(data_dict, indent=2)
 
+# Function to collect the canvas from the input widgets' session state
+def current_business_model_data():
+    return {component: st.session_state.get(component, '') or '' for component, _ in CANVAS_COMPONENTS}
+
 # Function to save JSON file
 def save_json_file(json_data, folder_path):
     try:
@@ -110,53 +164,103 @@ def save_combined_output(json_data, analysis_data, folder_path):
         logging.error(error_msg)
         raise Exception(error_msg)
 
-# Function to format GROQ output
-def format_output(text):
-    # Add proper line breaks and formatting
-    formatted_text = text.replace(". ", ".\n")
-    formatted_text = formatted_text.replace("• ", "\n• ")
-    return formatted_text
-
-# Function to get GROQ completion with proper formatting
-def get_groq_completion(prompt, system_prompt="You are an expert at business analysis and creation."):
+# Headings of the evaluation steps, in pipeline order
+EVALUATION_STEPS = [
+    ("initial_analysis", "### Step 1: Initial business model created based on user input"),
+    ("critique", "### Step 2: Critical analysis of the initial business model"),
+    ("optimization", "### Step 3: Optimized business model canvas"),
+]
+
+# Function to show the canvas sections of a step under component headings
+# After an incremental re-evaluation each heading says whether the section
+# was refreshed or reused from the previous evaluation.
+# Sections streamed by a running job arrive formatted already.
+def render_sections(sections, refreshed=None, formatted=False):
+    for key, label in CANVAS_COMPONENTS:
+        # A structured critique leaves components without issues empty
+        if sections.get(key):
+            if refreshed is None:
+                st.markdown(f"#### {label}")
+            else:
+                st.markdown(f"#### {label} ({'refreshed' if key in refreshed else 'reused'})")
+            st.markdown(sections[key] if formatted else format_output(sections[key]))
+
+# Function to show the evaluation steps: finished outputs, text still streaming
+# in and, for parallel Step 1 and structured output, the component sections as
+# they arrive. Finished steps with sections are shown per section as well.
+# partial and components come from a job snapshot and are formatted already.
+def render_evaluation(outputs, finished_steps, partial=None, components=None):
+    st.markdown("## Business Model Canvas Creation")
+    for step, heading in EVALUATION_STEPS:
+        st.markdown(heading)
+        finished = finished_steps.get(step)
+        if step in outputs:
+            if finished is not None and finished.get("sections"):
+                render_sections(finished["sections"], finished.get("refreshed"))
+            else:
+                st.markdown(format_output(outputs[step]))
+        elif partial and step in partial:
+            # Structured output that could not be parsed streams on as prose
+            st.markdown(partial[step])
+        elif components and step in components:
+            render_sections(components[step], formatted=True)
+        if finished is None:
+            continue
+        if finished["reused"]:
+            st.caption("Inputs unchanged since the last run, result reused")
+        elif finished["token_report"] is not None:
+            st.caption(describe_token_report(finished["token_report"]))
+        if finished.get("refreshed") is not None:
+            st.caption(f"Refreshed {len(finished['refreshed'])} of {len(CANVAS_COMPONENTS)} sections, "
+                       "the others were reused from the previous evaluation")
+
+# Function to summarize estimated vs actual token usage of a step
+def describe_token_report(report):
+    summary = f"Model: {report['model']}"
+    if report.get("fallback_reason"):
+        summary += f" (fallback, {report['requested_model']} {report['fallback_reason']})"
+    summary += (f"; tokens: ~{report['estimated_input_tokens']} estimated input "
+               f"(budget {report['input_budget']}), output capped at {report['max_output_tokens']}")
+    if report.get("from_cache"):
+        summary += "; served from cache"
+    elif "prompt_tokens" in report:
+        summary += f"; actual {report['prompt_tokens']} input, {report['completion_tokens']} output"
+    if report["compaction"]:
+        summary += f"; compacted: {', '.join(report['compaction'])}"
+    if report.get("prose_fallback"):
+        summary += "; structured output could not be parsed, shown as prose"
+    return summary
+
+# Function to queue an evaluation of the canvas for this session
+def submit_evaluation(business_model_data, use_cache=True, fan_out=False, structured=False):
     try:
-        client = Groq(api_key=api_key)
-        completion = client.chat.completions.create(
-            model="llama3-8b-8192",
-            messages=[
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=1,
-            max_tokens=1024,
-            top_p=1,
-            stream=True,
-            stop=None,
+        job = get_job_queue().submit(
+            st.session_state.user_id, api_key, business_model_data,
+            use_cache=use_cache, fan_out=fan_out, memo=get_step_memo(), structured=structured,
+            previous=get_evaluated_canvas()
         )
-        
-        # Create a placeholder for the streaming output
-        output_placeholder = st.empty()
-        response = ""
-        
-        for chunk in completion:
-            if chunk.choices[0].delta.content:
-                response += chunk.choices[0].delta.content
-                # Update the placeholder with formatted text
-                output_placeholder.markdown(format_output(response))
-        
-        logging.info("Successfully generated GROQ completion")
-        return response
+        st.session_state.job_id = job.id
+        get_session_store().delete(st.session_state.user_id, "evaluation")
+        # Rerun the whole app so the progress view below the Main tab starts polling
+        st.rerun()
+    except JobQueueFull as e:
+        logging.warning(f"Evaluation not queued: {str(e)}")
+        st.warning(str(e))
+
+# Function to find a stored evaluation of a near-identical canvas, or None
+def find_reusable_evaluation(business_model_data):
+    try:
+        match = get_canvas_index().find_reusable_run(business_model_data, get_reuse_threshold())
     except Exception as e:
-        error_msg = f"Error in GROQ completion: {str(e)}"
-        logging.error(error_msg)
-        st.error(error_msg)
+        # Lookup problems never block a fresh evaluation
+        logging.error(f"Error searching the canvas index: {str(e)}")
+        return None
+    if match is None:
         return None
+    run, similarity = match
+    logging.info(f"Found stored evaluation {run['id']} with canvas similarity {similarity:.3f}")
+    return {"canvas_hash": canvas_hash(business_model_data), "run_id": run["id"],
+            "similarity": similarity, "created_at": run["created_at"]}
 
 # Help text for each component
 HELP_TEXT = {
@@ -285,7 +389,12 @@ st.divider()
 # Create tabs
 tab1, tab2, tab3, tab4 = st.tabs(["Main", "DATA", "LOGGING", "README"])
 
-with tab1:
+# Each tab is a fragment, so widgets in one tab only rerun that tab.
+# Typing in the canvas fields reruns the Main tab, not the DATA, LOGGING and README tabs.
+@st.fragment
+def render_main_tab():
+    fragment_started = time.process_time()
+
     # create a description
     st.write("""This application will help you in creating, evaluating, and optimizing a business model canvas.""")
     st.write("""Inspired by Dries Faems at https://www.linkedin.com/in/dries-faems-0371569/""")
@@ -293,39 +402,48 @@ with tab1:
     # create inputs with default placeholder text
     value_proposition = st.text_area('What is the value proposition for your business model?', 
                                    help=HELP_TEXT["value_proposition"],
-                                   placeholder=DEFAULT_TEXTS["value_proposition"])
+                                   placeholder=DEFAULT_TEXTS["value_proposition"],
+                                   key="value_proposition")
     
     customer_profile = st.text_area('Please provide a description of the customer segment that you are targeting',
                                   help=HELP_TEXT["customer_profile"],
-                                  placeholder=DEFAULT_TEXTS["customer_profile"])
+                                  placeholder=DEFAULT_TEXTS["customer_profile"],
+                                  key="customer_profile")
     
     distribution_channel = st.text_area('Please provide a description of the distribution channel that you are using',
                                       help=HELP_TEXT["distribution_channel"],
-                                      placeholder=DEFAULT_TEXTS["distribution_channel"])
+                                      placeholder=DEFAULT_TEXTS["distribution_channel"],
+                                      key="distribution_channel")
     
     customer_relationship = st.text_area('Please provide a description of the customer relationship that you are building',
                                        help=HELP_TEXT["customer_relationship"],
-                                       placeholder=DEFAULT_TEXTS["customer_relationship"])
+                                       placeholder=DEFAULT_TEXTS["customer_relationship"],
+                                       key="customer_relationship")
     
     revenue_streams = st.text_area('Please provide a description of the revenue streams that you are generating',
                                  help=HELP_TEXT["revenue_streams"],
-                                 placeholder=DEFAULT_TEXTS["revenue_streams"])
+                                 placeholder=DEFAULT_TEXTS["revenue_streams"],
+                                 key="revenue_streams")
     
     key_resources = st.text_area('Please provide a description of the key resources that you are using',
                                help=HELP_TEXT["key_resources"],
-                               placeholder=DEFAULT_TEXTS["key_resources"])
+                               placeholder=DEFAULT_TEXTS["key_resources"],
+                               key="key_resources")
     
     key_activities = st.text_area('Please provide a description of the key activities that you are performing',
                                 help=HELP_TEXT["key_activities"],
-                                placeholder=DEFAULT_TEXTS["key_activities"])
+                                placeholder=DEFAULT_TEXTS["key_activities"],
+                                key="key_activities")
     
     key_partners = st.text_area('Please provide a description of the key partners that you are working with',
                               help=HELP_TEXT["key_partners"],
-                              placeholder=DEFAULT_TEXTS["key_partners"])
+                              placeholder=DEFAULT_TEXTS["key_partners"],
+                              key="key_partners")
     
     cost_structure = st.text_area('Please provide a description of the cost structure that you are facing',
                                 help=HELP_TEXT["cost_structure"],
-                                placeholder=DEFAULT_TEXTS["cost_structure"])
+                                placeholder=DEFAULT_TEXTS["cost_structure"],
+                                key="cost_structure")
 
     # Create business model data dictionary
     business_model_data = {
@@ -340,79 +458,134 @@ with tab1:
         "cost_structure": cost_structure
     }
 
-    initial_business_model_canvas = "\n".join([
-        f"Value proposition:\n{value_proposition}",
-        f"\nCustomer profile:\n{customer_profile}",
-        f"\nDistribution channel:\n{distribution_channel}",
-        f"\nCustomer relationship:\n{customer_relationship}",
-        f"\nRevenue streams:\n{revenue_streams}",
-        f"\nKey resources:\n{key_resources}",
-        f"\nKey activities:\n{key_activities}",
-        f"\nKey partners:\n{key_partners}",
-        f"\nCost structure:\n{cost_structure}"
-    ])
+    bypass_cache = st.checkbox('Bypass completion cache',
+                               help="Always request fresh completions from GROQ instead of reusing cached results for an identical canvas")
+    parallel_components = st.checkbox('Analyze components in parallel',
+                                      help="Step 1 analyzes each of the nine components as a separate request so they stream in side by side and each gets its own token budget")
+    structured_output = st.checkbox('Structured output per canvas section',
+                                    help="Each step answers per canvas component, so sections appear as they complete, the critique works per section and the optimization only rewrites the sections with issues")
+
+    # With structured output, a canvas evaluated before is only re-evaluated where it changed
+    evaluated_canvas = get_evaluated_canvas()
+    if (structured_output and not bypass_cache and evaluated_canvas is not None
+            and has_complete_sections(evaluated_canvas["sections"])):
+        changed = changed_components(evaluated_canvas["business_model_data"], business_model_data)
+        affected = affected_components(changed)
+        if changed and len(affected) < len(CANVAS_COMPONENTS):
+            labels = dict(CANVAS_COMPONENTS)
+            st.caption(f"Changed since the last evaluation: {', '.join(labels[key] for key in changed)}. "
+                       f"Only {len(affected)} of {len(CANVAS_COMPONENTS)} sections will be re-evaluated: "
+                       f"{', '.join(labels[key] for key in affected)}.")
 
     # create a button to start the generation of the business model canvas
-    if st.button('Start Business Model Evaluation'):
+    if st.session_state.job_id is not None:
+        st.button('Start Business Model Evaluation', disabled=True,
+                  help="An evaluation is already running for this session")
+    elif st.button('Start Business Model Evaluation'):
         if not api_key:
             st.error("Please enter and validate your GROQ API key first")
             logging.error("Attempted to start evaluation without valid API key")
             st.stop()
             
-        try:
-            # Step 1: Create initial business model
-            st.markdown("## Business Model Canvas Creation")
-            st.markdown("### Step 1: Initial business model created based on user input")
-            
-            create_prompt = f"""Create a business model canvas based on the following information. The business model canvas should be coherent and consistent. Pay special attention to the uniqueness of the business model canvas.
-
-Input from user:
-{initial_business_model_canvas}
-
-Provide a detailed analysis and suggestions for each component."""
-
-            st.session_state.initial_analysis = get_groq_completion(create_prompt)
-
-            # Step 2: Critique the business model
-            st.markdown("### Step 2: Critical analysis of the initial business model")
-            
-            critique_prompt = f"""Critique the following business model canvas to identify areas for improvement and optimization. Pay special attention to inconsistencies between different parts of the business model. Identify room for improvement in terms of uniqueness.
-
-Business Model Canvas:
-{st.session_state.initial_analysis}
-
-Provide a detailed critical analysis highlighting issues and inconsistencies."""
-
-            st.session_state.critique = get_groq_completion(critique_prompt)
-
-            # Step 3: Optimize the business model
-            st.markdown("### Step 3: Optimized business model canvas")
-            
-            optimize_prompt = f"""Create an optimized version of the business model canvas by addressing the following critical issues:
-
-Original Business Model:
-{st.session_state.initial_analysis}
+        # A near-identical canvas that was evaluated before is offered first
+        reuse_offer = None if bypass_cache else find_reusable_evaluation(business_model_data)
+        if (reuse_offer is not None and structured_output and evaluated_canvas is not None
+                and reuse_offer["run_id"] == evaluated_canvas["run_id"]):
+            # That is the evaluation being refreshed, so there is nothing to offer
+            reuse_offer = None
+        if reuse_offer is None:
+            submit_evaluation(business_model_data, use_cache=not bypass_cache, fan_out=parallel_components,
+                              structured=structured_output)
+        st.session_state.reuse_offer = reuse_offer
+
+    reuse_offer = st.session_state.get('reuse_offer')
+    if reuse_offer is not None and reuse_offer["canvas_hash"] != canvas_hash(business_model_data):
+        # The canvas was edited since the offer was made
+        reuse_offer = st.session_state.reuse_offer = None
+    if reuse_offer is not None and st.session_state.job_id is None:
+        st.info(f"A {reuse_offer['similarity']:.0%} similar canvas was evaluated on "
+                f"{reuse_offer['created_at'].strftime('%Y-%m-%d %H:%M')} (evaluation #{reuse_offer['run_id']}). "
+                "You can reuse that evaluation instead of running a new one.")
+        reuse_col1, reuse_col2 = st.columns([1, 1])
+        with reuse_col1:
+            if st.button("Use saved evaluation"):
+                stored_run = get_canvas_store().get_run(reuse_offer["run_id"])
+                use_stored_run(stored_run)
+                st.session_state.reuse_offer = None
+                logging.info(f"Reused stored evaluation {stored_run['id']} for a near-identical canvas")
+                st.rerun()
+        with reuse_col2:
+            if st.button("Run a fresh evaluation"):
+                st.session_state.reuse_offer = None
+                submit_evaluation(business_model_data, use_cache=not bypass_cache, fan_out=parallel_components,
+                                  structured=structured_output)
+
+    if st.session_state.job_id is None and get_evaluation()["initial_analysis"] is None and reuse_offer is None:
+        st.write('Please click the button to start the evaluation')
 
-Critical Analysis:
-{st.session_state.critique}
+    logging.debug(f"Main tab run took {(time.process_time() - fragment_started) * 1000:.1f} ms CPU")
+
+# Polls the session's job up to STREAM_MAX_FPS times a second and shows its partial output.
+# When the job ends its results are copied into the session and the app reruns
+# once so the static view below takes over.
+@st.fragment(run_every=stream_refresh_interval())
+def render_job_progress():
+    job_queue = get_job_queue()
+    job = job_queue.get(st.session_state.job_id)
+    if job is None:
+        st.session_state.job_id = None
+        st.warning("The evaluation is no longer available. Please start it again.")
+        return
+    snapshot = job.snapshot()
+
+    if snapshot["status"] == QUEUED:
+        position = job_queue.position(snapshot["id"])
+        st.info(f"Evaluation queued, {position or 0} evaluations ahead of it")
+        return
+    if snapshot["status"] in (DONE, FAILED):
+        get_session_store().put(st.session_state.user_id, "step_memo", snapshot["memo"])
+        set_evaluation(snapshot["outputs"].get("initial_analysis"), snapshot["outputs"].get("critique"),
+                       snapshot["outputs"].get("optimization"), snapshot["finished_steps"])
+        if snapshot["status"] == DONE:
+            st.session_state.run_id = snapshot["run_id"]
+            set_evaluated_canvas(job.business_model_data, snapshot["results"]["sections"], snapshot["run_id"])
+            st.session_state.last_run_metrics = [
+                report for report in snapshot["results"]["token_usage"].values()
+                if "duration_seconds" in report
+            ]
+        else:
+            st.session_state.evaluation_error = snapshot["error"]
+        st.session_state.job_id = None
+        # The results now live in the session store
+        job_queue.discard(snapshot["id"])
+        st.rerun()
 
-Provide a detailed optimized business model canvas addressing all identified issues."""
-
-            st.session_state.optimization = get_groq_completion(optimize_prompt)
-            
-            logging.info("Successfully completed business model evaluation")
-            
-        except Exception as e:
-            error_msg = f"Error during business model evaluation: {str(e)}"
-            logging.error(error_msg)
-            st.error(error_msg)
+    st.caption(f"Evaluation running ({job_queue.stats()['queued']} waiting in the queue)")
+    render_evaluation(snapshot["outputs"], snapshot["finished_steps"], snapshot["partial"], snapshot["components"])
 
+with tab1:
+    render_main_tab()
+    if st.session_state.job_id is not None:
+        render_job_progress()
     else:
-        st.write('Please click the button to start the evaluation')
-
-with tab2:
+        evaluation = get_evaluation()
+        if evaluation["initial_analysis"] is not None:
+            render_evaluation(
+                {step: evaluation[step] for step, _ in EVALUATION_STEPS if evaluation[step] is not None},
+                evaluation["finished_steps"]
+            )
+        if st.session_state.get('evaluation_error'):
+            st.error(st.session_state.evaluation_error)
+            del st.session_state.evaluation_error
+
+@st.fragment
+def render_data_tab():
     st.markdown("## Business Model Canvas Data")
     
+    # The canvas is read from the Main tab's inputs when this tab reruns
+    business_model_data = current_business_model_data()
+    st.button("Refresh from Main tab", help="Pick up edits made in the Main tab since this tab last updated")
+
     # Convert business model data to JSON
     json_data = create_business_model_json(business_model_data)
     
@@ -466,14 +639,15 @@ with tab2:
                         st.stop()
                 
                 # Prepare analysis data
+                evaluation = get_evaluation()
                 analysis_data = f"""Initial Analysis:
-{st.session_state.initial_analysis if st.session_state.initial_analysis else 'No analysis generated yet'}
+{evaluation['initial_analysis'] if evaluation['initial_analysis'] else 'No analysis generated yet'}
 
 Critical Analysis:
-{st.session_state.critique if st.session_state.critique else 'No critique generated yet'}
+{evaluation['critique'] if evaluation['critique'] else 'No critique generated yet'}
 
 Optimized Business Model:
-{st.session_state.optimization if st.session_state.optimization else 'No optimization generated yet'}
+{evaluation['optimization'] if evaluation['optimization'] else 'No optimization generated yet'}
 """
                 
                 json_path, txt_path = save_combined_output(edited_json, analysis_data, save_folder)
@@ -500,15 +674,192 @@ Optimized Business Model:
         - Combined output includes JSON and full analysis
         """)
 
-with tab3:
+    # Saved evaluations in the canvas store
+    st.markdown("### Saved Evaluations")
+    canvas_store = get_canvas_store()
+
+    if st.button("Save to Database"):
+        try:
+            evaluation = get_evaluation()
+            store_run_id = canvas_store.save_run(
+                json.loads(edited_json),
+                initial_analysis=evaluation["initial_analysis"],
+                critique=evaluation["critique"],
+                optimization=evaluation["optimization"],
+                metadata={"saved_from": "DATA tab"}
+            )
+            st.success(f"Saved evaluation #{store_run_id} to the database")
+        except json.JSONDecodeError as e:
+            error_msg = f"Invalid JSON format: {str(e)}"
+            logging.error(error_msg)
+            st.error(error_msg)
+        except Exception as e:
+            st.error(f"Error saving to database: {str(e)}")
+
+    store_col1, store_col2 = st.columns([3, 1])
+    with store_col1:
+        store_query = st.text_input("Search canvases and analyses", help="Full-text search; all words must match")
+    with store_col2:
+        store_page = st.number_input("Page", min_value=0, value=0, step=1, key="store_page")
+    similar_search = st.checkbox("Match similar wording",
+                                 help="Rank evaluations by how closely their canvas and analyses match the search text, instead of requiring every word")
+
+    try:
+        store_page_size = 20
+        if similar_search and store_query.strip():
+            # Vector search returns the closest matches only, so there is a single page
+            similarities = {}
+            store_runs = []
+            for similar_run_id, similarity in get_canvas_index().search(store_query, limit=store_page_size):
+                similar_run = canvas_store.get_run(similar_run_id)
+                if similar_run is not None:
+                    similarities[similar_run_id] = similarity
+                    store_runs.append(dict(similar_run, value_proposition=similar_run["canvas"].get("value_proposition")))
+            st.caption(f"{len(store_runs)} most similar saved evaluations")
+        else:
+            similarities = None
+            store_runs, store_total = canvas_store.list_runs(store_query, page=int(store_page), page_size=store_page_size)
+            st.caption(f"{store_total} saved evaluations, showing page {int(store_page)} "
+                       f"of {max(0, (store_total - 1) // store_page_size)}")
+        if store_runs:
+            store_rows = []
+            for run in store_runs:
+                store_row = {
+                    "ID": run["id"],
+                    "Saved": run["created_at"].strftime("%Y-%m-%d %H:%M:%S"),
+                    "Value proposition": (run["value_proposition"] or "")[:80],
+                }
+                if similarities is not None:
+                    store_row["Similarity"] = f"{similarities[run['id']]:.0%}"
+                store_rows.append(store_row)
+            st.dataframe(store_rows, hide_index=True)
+
+            selected_run_id = st.selectbox("Evaluation to load", [run["id"] for run in store_runs])
+            if st.button("Load Evaluation"):
+                stored_run = canvas_store.get_run(selected_run_id)
+                st.session_state.loaded_canvas = stored_run["canvas"]
+                use_stored_run(stored_run)
+                logging.info(f"Loaded evaluation run {stored_run['id']} from canvas store")
+                st.rerun()
+    except Exception as e:
+        st.error(f"Error reading database: {str(e)}")
+
+    with st.expander("Import business_plan files"):
+        st.write("Imports the business_plan_*.json/.txt files in the save folder above. Files imported before are skipped.")
+        if st.button("Import Files"):
+            try:
+                imported_count = canvas_store.import_flat_files(save_folder)
+                st.success(f"Imported {imported_count} evaluations from {save_folder}")
+            except Exception as e:
+                st.error(f"Error importing files: {str(e)}")
+
+    with st.expander("Bulk export and import"):
+        st.write("Exports every saved evaluation to one Parquet or Excel file in the save folder above, "
+                 "or imports such a file back. Evaluations imported before are skipped.")
+        bulk_format = st.selectbox("Format", EXPORT_FORMATS, format_func=lambda suffix: suffix.lstrip(".").upper(),
+                                   help="XLSX cuts texts off at 32,767 characters and drops control characters. "
+                                        "Use Parquet to export and import evaluations without loss.")
+        bulk_datestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        export_path = os.path.join(save_folder, f"evaluations_{bulk_datestamp}{bulk_format}")
+        bulk_col1, bulk_col2 = st.columns([1, 1])
+        with bulk_col1:
+            if st.button("Export All Evaluations"):
+                try:
+                    with st.spinner("Exporting evaluations..."):
+                        exported_count, altered_cells = export_runs(export_path, store=canvas_store)
+                    st.success(f"Exported {exported_count} evaluations to {export_path}")
+                    if altered_cells:
+                        st.warning(f"{altered_cells} cells were shortened to Excel's 32,767-character limit or "
+                                   "had control characters removed. Export to Parquet to keep them unchanged.")
+                except Exception as e:
+                    logging.error(f"Error exporting evaluations: {str(e)}")
+                    st.error(f"Error exporting evaluations: {str(e)}")
+        with bulk_col2:
+            import_path = st.text_input("File to import", help="Path of a .parquet or .xlsx file written by the export")
+            if st.button("Import Evaluations"):
+                try:
+                    with st.spinner("Importing evaluations..."):
+                        imported_count = import_runs(import_path, store=canvas_store)
+                    st.success(f"Imported {imported_count} evaluations from {import_path}")
+                except Exception as e:
+                    logging.error(f"Error importing evaluations: {str(e)}")
+                    st.error(f"Error importing evaluations: {str(e)}")
+
+with tab2:
+    render_data_tab()
+
+@st.fragment
+def render_logging_tab():
     st.markdown("## Logging")
+    st.button("Refresh Logs")
+    log_col1, log_col2, log_col3 = st.columns([2, 2, 1])
+    with log_col1:
+        log_levels = st.multiselect("Levels", LOG_LEVELS, default=LOG_LEVELS)
+    with log_col2:
+        log_dates = st.date_input("Date range", value=(), help="Leave empty to show all dates")
+    with log_col3:
+        log_page_size = st.selectbox("Lines per page", [100, 200, 500, 1000], index=1)
+    log_page = st.number_input("Page (0 = newest)", min_value=0, value=0, step=1)
+
+    # Only the requested page is read, starting from the end of the file
+    log_since = log_until = None
+    if len(log_dates) > 0:
+        log_since = datetime.datetime.combine(log_dates[0], datetime.time.min)
+        log_until = datetime.datetime.combine(log_dates[-1], datetime.time.max)
     try:
-        with open('log.txt', 'r') as log_file:
-            log_content = log_file.read()
-            st.text_area("Application Logs", log_content, height=400)
+        log_records, log_has_more = read_log_page(
+            'log.txt', levels=log_levels, since=log_since, until=log_until,
+            page=int(log_page), page_size=log_page_size
+        )
+        log_content = "\n".join(record["text"] for record in log_records)
+        st.text_area("Application Logs", log_content, height=400)
+        if log_has_more:
+            st.caption("Older entries available on the next page")
+    except FileNotFoundError:
+        st.info("No log entries yet")
     except Exception as e:
         st.error(f"Error reading log file: {str(e)}")
 
+    # Completion latency and throughput
+    st.markdown("### Performance")
+    metric_columns = ["step", "model", "from_cache", "queue_wait_seconds", "retries", "ttft_seconds", "duration_seconds",
+                      "render_seconds", "chunks", "tokens_per_second", "prompt_tokens", "completion_tokens"]
+    if st.session_state.get('last_run_metrics'):
+        st.markdown("**Last evaluation**")
+        st.dataframe([{column: report.get(column) for column in metric_columns}
+                      for report in st.session_state.last_run_metrics], hide_index=True)
+    completion_metrics = get_metrics()
+    metric_counters = completion_metrics.counters()
+    st.markdown(f"**Rolling percentiles** (last {len(completion_metrics.recent())} completions in this process, "
+                f"{metric_counters.get('cache_hits', 0)} cache hits, {metric_counters.get('errors', 0)} errors)")
+    st.dataframe(completion_metrics.summary(), hide_index=True)
+    limiter_stats = rate_limiter_stats()
+    if limiter_stats:
+        st.caption(f"Rate limiter: {limiter_stats['in_flight']} requests running, {limiter_stats['waiting']} waiting, "
+                   f"{limiter_stats['rate_limited']} rate-limited responses, "
+                   f"{limiter_stats['wait_seconds']:.1f}s total queue wait")
+    st.caption("Also exported as Prometheus text format to metrics.prom and as JSON lines to metrics.jsonl")
+
+    # Memory held by session results, this session's and all sessions'
+    st.markdown("### Session Storage")
+    own_session = get_session_store().session_stats(st.session_state.user_id)
+    all_sessions = session_store_stats()
+    st.dataframe([
+        {"Scope": "This session", "Sessions in memory": None, "Values": own_session["payloads"],
+         "Memory (KB)": own_session["memory_bytes"] / 1024, "Disk (KB)": own_session["disk_bytes"] / 1024},
+        {"Scope": "All sessions", "Sessions in memory": all_sessions["sessions_in_memory"],
+         "Values": all_sessions["disk_files"], "Memory (KB)": all_sessions["memory_bytes"] / 1024,
+         "Disk (KB)": all_sessions["disk_bytes"] / 1024},
+    ], hide_index=True)
+    st.caption(f"Memory capped at {all_sessions['max_memory_bytes'] / (1024 * 1024):.0f} MB; "
+               f"{all_sessions['evicted_sessions']} idle sessions moved out of memory, "
+               f"{all_sessions['rehydrated']} values read back from disk")
+
+with tab3:
+    render_logging_tab()
+
 with tab4:
     st.markdown("## README")
     st.markdown(read_readme())
+
+logging.debug(f"Full script run took {(time.process_time() - script_run_started) * 1000:.1f} ms CPU")
@@ -0,0 +1,201 @@
+import collections
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app_logging import METRICS_LOGGER
+from rate_limiter import rate_limiter_stats
+from session_store import session_store_stats
+
+DEFAULT_WINDOW_SIZE = 1000
+DEFAULT_PROMETHEUS_FILE = 'metrics.prom'
+# Address the /metrics endpoint listens on; only this machine by default
+DEFAULT_METRICS_HOST = '127.0.0.1'
+PERCENTILES = (50, 95, 99)
+
+# Timing fields summarized as percentiles, with their Prometheus help text
+TIMING_METRICS = {
+    "ttft_seconds": "Time from request to first streamed token",
+    "duration_seconds": "Total completion duration including rendering",
+    "render_seconds": "Time spent rendering streamed chunks",
+    "tokens_per_second": "Completion tokens per second after the first token",
+    "queue_wait_seconds": "Time spent waiting for the GROQ rate limiter",
+}
+# Size fields summarized as percentiles
+SIZE_METRICS = {
+    "chunks": "Streamed chunks per completion",
+    "prompt_chars": "Prompt size in characters",
+    "completion_chars": "Completion size in characters",
+    "prompt_tokens": "Prompt tokens reported by GROQ",
+    "completion_tokens": "Completion tokens reported by GROQ",
+    "retries": "Retried GROQ requests per completion",
+}
+
+
+# Function to compute a percentile of a list of numbers (nearest-rank)
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+# Process-wide record of recent completions.
+# Keeps a rolling window for percentiles plus lifetime counters, appends every
+# record to the JSON metrics log and rewrites a Prometheus text-format file.
+class CompletionMetrics:
+    def __init__(self, window_size=DEFAULT_WINDOW_SIZE, prometheus_file=DEFAULT_PROMETHEUS_FILE):
+        self.prometheus_file = prometheus_file
+        self._records = collections.deque(maxlen=window_size)
+        self._counters = collections.Counter()
+        self._sums = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, record):
+        record = dict(record, timestamp=time.time())
+        with self._lock:
+            self._records.append(record)
+            self._counters["completions"] += 1
+            if record.get("from_cache"):
+                self._counters["cache_hits"] += 1
+            if record.get("error"):
+                self._counters["errors"] += 1
+            self._counters["rate_limited"] += record.get("rate_limited", 0)
+            self._counters["retries"] += record.get("retries", 0)
+            for field in TIMING_METRICS:
+                if isinstance(record.get(field), (int, float)):
+                    self._sums[field] += record[field]
+        logging.getLogger(METRICS_LOGGER).info(json.dumps(record, default=str))
+        if self.prometheus_file:
+            self._write_prometheus_file()
+
+    def recent(self, limit=None):
+        with self._lock:
+            records = list(self._records)
+        return records[-limit:] if limit else records
+
+    # Rolling p50/p95/p99 of every metric over the window, optionally for one step
+    def summary(self, step=None):
+        records = [record for record in self.recent()
+                   if not record.get("error") and (step is None or record.get("step") == step)]
+        rows = []
+        for field in list(TIMING_METRICS) + list(SIZE_METRICS):
+            values = [record[field] for record in records if isinstance(record.get(field), (int, float))]
+            row = {"metric": field, "count": len(values)}
+            for pct in PERCENTILES:
+                row[f"p{pct}"] = percentile(values, pct)
+            rows.append(row)
+        return rows
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def prometheus_text(self):
+        lines = []
+        counters = self.counters()
+        lines.append("# HELP groq_completions_total Completions requested, by cache result")
+        lines.append("# TYPE groq_completions_total counter")
+        hits = counters.get("cache_hits", 0)
+        lines.append(f'groq_completions_total{{cache="hit"}} {hits}')
+        lines.append(f'groq_completions_total{{cache="miss"}} {counters.get("completions", 0) - hits}')
+        lines.append("# HELP groq_completion_errors_total Completions that raised an error")
+        lines.append("# TYPE groq_completion_errors_total counter")
+        lines.append(f"groq_completion_errors_total {counters.get('errors', 0)}")
+        lines.append("# HELP groq_rate_limited_total Requests answered with 429 Too Many Requests")
+        lines.append("# TYPE groq_rate_limited_total counter")
+        lines.append(f"groq_rate_limited_total {counters.get('rate_limited', 0)}")
+        lines.append("# HELP groq_retries_total Requests retried after a rate limit or transient error")
+        lines.append("# TYPE groq_retries_total counter")
+        lines.append(f"groq_retries_total {counters.get('retries', 0)}")
+
+        limiter = rate_limiter_stats()
+        for name, help_text in (("in_flight", "Requests currently running"),
+                                ("waiting", "Requests waiting for the rate limiter"),
+                                ("concurrency_limit", "Adaptive limit on concurrent requests")):
+            lines.append(f"# HELP groq_rate_limiter_{name} {help_text}")
+            lines.append(f"# TYPE groq_rate_limiter_{name} gauge")
+            lines.append(f"groq_rate_limiter_{name} {limiter.get(name, 0)}")
+
+        sessions = session_store_stats()
+        for name, help_text in (("sessions_in_memory", "Sessions with results held in memory"),
+                                ("memory_bytes", "Size of session results held in memory"),
+                                ("disk_bytes", "Compressed size of session results on disk")):
+            lines.append(f"# HELP session_store_{name} {help_text}")
+            lines.append(f"# TYPE session_store_{name} gauge")
+            lines.append(f"session_store_{name} {sessions.get(name, 0)}")
+
+        summary = {row["metric"]: row for row in self.summary()}
+        with self._lock:
+            sums = dict(self._sums)
+        for field, help_text in {**TIMING_METRICS, **SIZE_METRICS}.items():
+            row = summary[field]
+            name = f"groq_completion_{field}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for pct in PERCENTILES:
+                value = row[f"p{pct}"]
+                lines.append(f'{name}{{quantile="{pct / 100}"}} {value if value is not None else "NaN"}')
+            if field in sums:
+                lines.append(f"{name}_sum {sums[field]}")
+            lines.append(f"{name}_count {row['count']}")
+        return "\n".join(lines) + "\n"
+
+    # Write to a temporary file and rename, so scrapers never see a partial file
+    def _write_prometheus_file(self):
+        try:
+            directory = os.path.dirname(os.path.abspath(self.prometheus_file))
+            with tempfile.NamedTemporaryFile('w', dir=directory, delete=False, suffix='.tmp') as f:
+                f.write(self.prometheus_text())
+            os.replace(f.name, self.prometheus_file)
+        except OSError as e:
+            logging.error(f"Could not write Prometheus metrics file: {str(e)}")
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics = None
+_server = None
+_metrics_lock = threading.Lock()
+
+
+# Process-wide metrics instance. When METRICS_PORT is set, a /metrics endpoint
+# is also served on METRICS_HOST from a background thread.
+def get_metrics():
+    global _metrics, _server
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = CompletionMetrics(
+                window_size=int(os.getenv('METRICS_WINDOW_SIZE', DEFAULT_WINDOW_SIZE)),
+                prometheus_file=os.getenv('METRICS_PROMETHEUS_FILE', DEFAULT_PROMETHEUS_FILE)
+            )
+            port = os.getenv('METRICS_PORT')
+            if port:
+                host = os.getenv('METRICS_HOST', DEFAULT_METRICS_HOST)
+                try:
+                    _server = ThreadingHTTPServer((host, int(port)), _MetricsRequestHandler)
+                    threading.Thread(target=_server.serve_forever, daemon=True).start()
+                    logging.info(f"Serving Prometheus metrics on {host}:{port}")
+                except OSError as e:
+                    logging.error(f"Could not start metrics endpoint on port {port}: {str(e)}")
+        return _metrics
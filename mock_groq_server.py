@@ -0,0 +1,211 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the GROQ chat completions API, for benchmarks and offline
+# development. Point the app at it with GROQ_BASE_URL=http://127.0.0.1:<port>.
+#
+#   python mock_groq_server.py --port 8787 --chunk-delay 0.02 --rate-limit-rate 0.1
+#
+# Streamed responses are replayed as server-sent events with configurable chunk
+# sizes and delays; a share of requests can fail with 500s or 429s, or drop the
+# connection halfway through the stream.
+
+DEFAULT_RESPONSE_TEXT = (
+    "The value proposition is clear and addresses a real pain point. "
+    "• Strength: the automation reduces operational costs. "
+    "• Weakness: the customer segment is broad and the channels overlap. "
+    "Revenue streams depend on subscriptions, which fits the recurring value delivered. "
+    "Key resources and activities are consistent with the proposition. "
+    "Cost structure is dominated by development salaries and infrastructure. "
+)
+
+
+class MockGroqConfig:
+    def __init__(self, response_chars=4000, chunk_size=12, chunk_delay=0.01, ttft_delay=0.2,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1, seed=None, disconnect_rate=0.0):
+        self.response_chars = response_chars
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.ttft_delay = ttft_delay
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.disconnect_rate = disconnect_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "disconnected": 0}
+        self.stats_lock = threading.Lock()
+
+    def response_text(self):
+        repeats = self.response_chars // len(DEFAULT_RESPONSE_TEXT) + 1
+        return (DEFAULT_RESPONSE_TEXT * repeats)[:self.response_chars]
+
+    def roll(self):
+        with self.random_lock:
+            return self.random.random()
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+
+class _MockGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        # HTTP/1.1 chunked transfer encoding, so the connection stays reusable
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/openai/v1/models":
+            self._send_json(200, {"object": "list", "data": [
+                {"id": "llama3-8b-8192", "object": "model", "created": 0, "owned_by": "mock"}
+            ]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") != "/openai/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        config = self.config
+        config.count("requests")
+
+        if config.roll() < config.rate_limit_rate:
+            config.count("rate_limited")
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "tokens",
+                                            "code": "rate_limit_exceeded"}},
+                            headers={"Retry-After": str(config.retry_after)})
+            return
+        if config.roll() < config.error_rate:
+            config.count("errors")
+            self._send_json(500, {"error": {"message": "Internal server error", "type": "internal_server_error"}})
+            return
+
+        model = request.get("model", "llama3-8b-8192")
+        text = config.response_text()
+        max_chars = request.get("max_tokens", 1024) * 4
+        text = text[:max_chars]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        prompt_chars = sum(len(message.get("content", "")) for message in request.get("messages", []))
+        usage = {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(text) // 4,
+                 "total_tokens": (prompt_chars + len(text)) // 4}
+
+        def chunk_payload(delta, finish_reason=None, extra=None):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                       "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            payload.update(extra or {})
+            return b"data: " + json.dumps(payload).encode('utf-8') + b"\n\n"
+
+        if not request.get("stream"):
+            time.sleep(config.ttft_delay)
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        disconnect_at = None
+        if config.roll() < config.disconnect_rate:
+            config.count("disconnected")
+            disconnect_at = len(text) // 2
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            time.sleep(config.ttft_delay)
+            self._write_chunk(chunk_payload({"role": "assistant", "content": ""}))
+            for start in range(0, len(text), config.chunk_size):
+                if disconnect_at is not None and start >= disconnect_at:
+                    # End the connection without the terminating chunk
+                    self.close_connection = True
+                    return
+                self._write_chunk(chunk_payload({"content": text[start:start + config.chunk_size]}))
+                if config.chunk_delay:
+                    time.sleep(config.chunk_delay)
+            self._write_chunk(chunk_payload({}, "stop", {"x_groq": {"id": completion_id, "usage": usage}}))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config, host="127.0.0.1", port=0):
+        super().__init__((host, port), _MockGroqHandler)
+        self.config = config
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+# Function to start the mock server on a background thread; port 0 picks a free port
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    server = MockGroqServer(config or MockGroqConfig(), host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock of the GROQ chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--response-chars", type=int, default=4000)
+    parser.add_argument("--chunk-size", type=int, default=12, help="Characters per streamed chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="Seconds between chunks")
+    parser.add_argument("--ttft-delay", type=float, default=0.2, help="Seconds before the first chunk")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="Share of streams cut off halfway through")
+    args = parser.parse_args(argv)
+
+    config = MockGroqConfig(args.response_chars, args.chunk_size, args.chunk_delay, args.ttft_delay,
+                            args.error_rate, args.rate_limit_rate, args.retry_after,
+                            disconnect_rate=args.disconnect_rate)
+    server = MockGroqServer(config, args.host, args.port)
+    print(f"Mock GROQ API listening on {server.base_url} (set GROQ_BASE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
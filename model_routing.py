@@ -0,0 +1,90 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from token_budget import max_output_tokens
+
+DEFAULT_MODEL = "llama3-8b-8192"
+DEFAULT_FALLBACK_MODEL = "llama-3.1-8b-instant"
+DEFAULT_ROUTES_FILE = 'model_routes.json'
+# Seconds without a first token (or between chunks) before the fallback model takes over
+DEFAULT_FALLBACK_AFTER_SECONDS = 15.0
+# Recent completions of a model looked at when deciding whether it is too slow
+SLOW_MODEL_WINDOW_SECONDS = 300
+SLOW_MODEL_MIN_SAMPLES = 3
+# Fallback reason of requests routed away from a model because it was slow
+SLOW_MODEL_REASON = "recently slow"
+
+ROUTE_FIELDS = ("model", "temperature", "max_tokens", "fallback_model", "fallback_after_seconds")
+
+
+# Function to build the built-in route of a step: the same model and sampling
+# for every step, with each step's own output budget
+def default_route(step):
+    return {
+        "model": DEFAULT_MODEL,
+        "temperature": 1,
+        "max_tokens": max_output_tokens(step),
+        "fallback_model": DEFAULT_FALLBACK_MODEL,
+        "fallback_after_seconds": DEFAULT_FALLBACK_AFTER_SECONDS,
+    }
+
+
+_routes = None
+_routes_lock = threading.Lock()
+
+
+# Function to read the routing table: step name -> overrides of the default route.
+# A missing file means every step uses the defaults.
+def load_routes(path=None):
+    path = path or os.getenv('MODEL_ROUTES_FILE', DEFAULT_ROUTES_FILE)
+    try:
+        with open(path, 'r') as f:
+            routes = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error(f"Could not read model routes from {path}, using defaults: {str(e)}")
+        return {}
+    for step, route in routes.items():
+        unknown = set(route) - set(ROUTE_FIELDS)
+        if unknown:
+            logging.warning(f"Ignoring unknown model route fields for {step}: {', '.join(sorted(unknown))}")
+    return routes
+
+
+# Function to get the model, sampling settings and fallback for a pipeline step.
+# Parallel component analyses ("initial_analysis:<component>") use Step 1's route.
+def get_step_route(step):
+    global _routes
+    with _routes_lock:
+        if _routes is None:
+            _routes = load_routes()
+        overrides = _routes.get(step.split(":")[0], {})
+    route = default_route(step.split(":")[0])
+    route.update({field: overrides[field] for field in ROUTE_FIELDS if field in overrides})
+    return route
+
+
+# Function to decide whether a model has recently been too slow to try first:
+# its median time to first token over the last few minutes is above the
+# threshold. A request the model failed to answer (timeout, 429, 5xx) and
+# handed to the fallback counts as a sample over the threshold. Old samples
+# age out, so the model is tried again later.
+def is_model_slow(model, threshold_seconds, recent_records):
+    cutoff = time.time() - SLOW_MODEL_WINDOW_SECONDS
+    ttfts = []
+    for record in recent_records:
+        if record.get("timestamp", 0) < cutoff or record.get("from_cache"):
+            continue
+        if record.get("model") == model and isinstance(record.get("ttft_seconds"), (int, float)):
+            ttfts.append(record["ttft_seconds"])
+        elif (record.get("requested_model") == model
+              and record.get("fallback_reason") not in (None, SLOW_MODEL_REASON)):
+            ttfts.append(float("inf"))
+    ttfts.sort()
+    if len(ttfts) < SLOW_MODEL_MIN_SAMPLES:
+        return False
+    return ttfts[len(ttfts) // 2] > threshold_seconds
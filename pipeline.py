@@ -0,0 +1,828 @@
+import hashlib
+import json
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from groq import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from completion_cache import get_completion_cache
+from groq_client import get_groq_client
+from metrics import get_metrics
+from model_routing import DEFAULT_MODEL, SLOW_MODEL_REASON, get_step_route, is_model_slow
+from rate_limiter import backoff_delay, get_max_retries, get_rate_limiter
+from structured_output import StreamingSectionParser
+from token_budget import (compact_sections, count_tokens, extract_issues, fit_to_budget, input_budget,
+                          mentioned_labels)
+
+SYSTEM_PROMPT = "You are an expert at business analysis and creation."
+
+# Errors worth retrying: rate limits, server errors and dropped connections,
+# including connections that break while a response is streaming
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError, httpx.TransportError)
+# Errors that mean the model is overloaded or too slow, so a fallback model is tried instead
+# (a timeout while waiting for the first streamed chunk surfaces from httpx)
+FALLBACK_ERRORS = {RateLimitError: "rate limited", InternalServerError: "overloaded", APITimeoutError: "too slow",
+                   httpx.TimeoutException: "too slow"}
+
+# Canvas components in the order they are presented to the model
+CANVAS_COMPONENTS = [
+    ("value_proposition", "Value proposition"),
+    ("customer_profile", "Customer profile"),
+    ("distribution_channel", "Distribution channel"),
+    ("customer_relationship", "Customer relationship"),
+    ("revenue_streams", "Revenue streams"),
+    ("key_resources", "Key resources"),
+    ("key_activities", "Key activities"),
+    ("key_partners", "Key partners"),
+    ("cost_structure", "Cost structure"),
+]
+
+
+# Function to turn business model data into the canvas text sent to GROQ
+def build_canvas_text(business_model_data):
+    sections = []
+    for index, (key, label) in enumerate(CANVAS_COMPONENTS):
+        prefix = "" if index == 0 else "\n"
+        sections.append(f"{prefix}{label}:\n{business_model_data.get(key, '')}")
+    return "\n".join(sections)
+
+
+# Step 1 prompt
+def build_create_prompt(canvas_text):
+    return f"""Create a business model canvas based on the following information. The business model canvas should be coherent and consistent. Pay special attention to the uniqueness of the business model canvas.
+
+Input from user:
+{canvas_text}
+
+Provide a detailed analysis and suggestions for each component."""
+
+
+# Step 1 prompt for a single component when the components are analyzed in parallel
+def build_component_prompt(canvas_text, label):
+    return f"""Analyze the {label.lower()} component of the business model canvas below. Check that it is coherent and consistent with the other components. Pay special attention to the uniqueness of the business model canvas.
+
+Input from user:
+{canvas_text}
+
+Provide a detailed analysis and suggestions for the {label.lower()} component only."""
+
+
+# Function to merge per-component analyses into a single Step 1 result.
+# Also turns the sections of a structured step into its stored text; components
+# without a section are left out.
+def merge_component_analyses(analyses):
+    return "\n\n".join(f"{label}:\n{analyses[key]}" for key, label in CANVAS_COMPONENTS if key in analyses)
+
+
+# Function to split text written by merge_component_analyses back into its
+# sections. Returns None for text in any other form (a prose analysis).
+def split_component_analyses(text):
+    if not text:
+        return None
+    headings = []
+    start = 0
+    for key, label in CANVAS_COMPONENTS:
+        heading = f"{label}:\n"
+        index = text.find(heading, start)
+        # Headings start the text or follow the blank line between sections
+        while index > 0 and text[index - 2:index] != "\n\n":
+            index = text.find(heading, index + 1)
+        if index == -1:
+            continue
+        headings.append((key, index, index + len(heading)))
+        start = index + len(heading)
+    if not headings or headings[0][1] != 0:
+        return None
+    sections = {}
+    for position, (key, _, body_start) in enumerate(headings):
+        body_end = headings[position + 1][1] - 2 if position + 1 < len(headings) else len(text)
+        sections[key] = text[body_start:body_end]
+    return sections
+
+
+# Step 2 prompt
+def build_critique_prompt(initial_analysis):
+    return f"""Critique the following business model canvas to identify areas for improvement and optimization. Pay special attention to inconsistencies between different parts of the business model. Identify room for improvement in terms of uniqueness.
+
+Business Model Canvas:
+{initial_analysis}
+
+Provide a detailed critical analysis highlighting issues and inconsistencies."""
+
+
+# Step 3 prompt
+def build_optimize_prompt(initial_analysis, critique):
+    return f"""Create an optimized version of the business model canvas by addressing the following critical issues:
+
+Original Business Model:
+{initial_analysis}
+
+Critical Analysis:
+{critique}
+
+Provide a detailed optimized business model canvas addressing all identified issues."""
+
+
+# Structured output: the step answers with a JSON object keyed by canvas
+# component, which is parsed while it streams (see structured_output.py)
+def build_structured_instructions(keys):
+    key_list = ", ".join(f'"{key}"' for key in keys)
+    return f"""Respond with a single JSON object and nothing else. Use exactly these keys, in this order: {key_list}. Each value must be a string."""
+
+
+# Function to name the components a structured prompt asks for, when it asks
+# for some of them only
+def _requested_components(keys):
+    if len(keys) == len(CANVAS_COMPONENTS):
+        return "each component"
+    labels = dict(CANVAS_COMPONENTS)
+    return "each of these components only: " + ", ".join(labels[key].lower() for key in keys)
+
+
+# Step 1 prompt in structured mode; keys limits the analysis to some components
+def build_structured_create_prompt(canvas_text, keys=None):
+    keys = keys or [key for key, _ in CANVAS_COMPONENTS]
+    return f"""Create a business model canvas based on the following information. The business model canvas should be coherent and consistent. Pay special attention to the uniqueness of the business model canvas.
+
+Input from user:
+{canvas_text}
+
+Provide a detailed analysis and suggestions for {_requested_components(keys)}. {build_structured_instructions(keys)}"""
+
+
+# Step 2 prompt in structured mode: issues are reported per component;
+# keys limits the critique to some components
+def build_structured_critique_prompt(initial_analysis, keys=None):
+    keys = keys or [key for key, _ in CANVAS_COMPONENTS]
+    return f"""Critique the following business model canvas to identify areas for improvement and optimization. Pay special attention to inconsistencies between different parts of the business model. Identify room for improvement in terms of uniqueness.
+
+Business Model Canvas:
+{initial_analysis}
+
+For {_requested_components(keys)}, list its issues and inconsistencies as bullet points, or give an empty string if it has none. {build_structured_instructions(keys)}"""
+
+
+# Step 3 prompt in structured mode, for the components the critique found issues with
+def build_structured_optimize_prompt(initial_analysis, critique, keys):
+    return f"""Create an optimized version of the following components of a business model canvas by addressing the critical issues listed for each of them:
+
+Original Components:
+{initial_analysis}
+
+Critical Issues:
+{critique}
+
+Provide a detailed optimized version of each of these components addressing all identified issues. {build_structured_instructions(keys)}"""
+
+
+# Function to build the prompt for a pipeline step within the step's token budget.
+# When the full prompt would not fit the model's context window next to the
+# step's output budget, upstream material is compacted: first the critique is
+# reduced to its issue list, then the initial analysis to the canvas sections the
+# critique mentions, and only then is text truncated.
+# The step's route decides the model and output budget; the prompt must also
+# fit the route's fallback model.
+# In structured mode the critique reads the sections of the initial analysis and
+# the optimization only the sections the critique found issues with, next to
+# those issues; the report lists the sections requested under "sections".
+# only_sections limits Step 1 and the critique to some components.
+# Returns the prompt and a report of the estimated token usage.
+def build_step_prompt(step, canvas_text="", initial_analysis="", critique="",
+                      model=None, system_prompt=SYSTEM_PROMPT, structured=False,
+                      initial_sections=None, critique_sections=None, only_sections=None):
+    route = get_step_route(step)
+    model = model or route["model"]
+    budget = input_budget(step, model, system_prompt, route["max_tokens"])
+    if route["fallback_model"]:
+        budget = min(budget, input_budget(step, route["fallback_model"], system_prompt, route["max_tokens"]))
+    labels = [label for _, label in CANVAS_COMPONENTS]
+    compaction = []
+    section_keys = None
+
+    if structured:
+        prompt, section_keys = _build_structured_prompt(step, canvas_text, initial_sections, critique_sections,
+                                                        budget, compaction, only_sections)
+    elif step == "initial_analysis":
+        prompt = build_create_prompt(canvas_text)
+        if count_tokens(prompt) > budget:
+            overhead = count_tokens(build_create_prompt(""))
+            prompt = build_create_prompt(fit_to_budget(canvas_text, budget - overhead))
+            compaction.append("truncated canvas")
+    elif step == "critique":
+        prompt = build_critique_prompt(initial_analysis)
+        if count_tokens(prompt) > budget:
+            overhead = count_tokens(build_critique_prompt(""))
+            prompt = build_critique_prompt(compact_sections(initial_analysis, labels, budget - overhead))
+            compaction.append("compacted initial analysis")
+    elif step == "optimization":
+        prompt = build_optimize_prompt(initial_analysis, critique)
+        if count_tokens(prompt) > budget:
+            critique = extract_issues(critique)
+            prompt = build_optimize_prompt(initial_analysis, critique)
+            compaction.append("critique issue list")
+        if count_tokens(prompt) > budget:
+            overhead = count_tokens(build_optimize_prompt("", critique))
+            initial_analysis = compact_sections(initial_analysis, labels, budget - overhead,
+                                                keep_labels=mentioned_labels(critique, labels))
+            prompt = build_optimize_prompt(initial_analysis, critique)
+            compaction.append("relevant canvas sections")
+        if count_tokens(prompt) > budget:
+            remaining = budget - count_tokens(build_optimize_prompt("", ""))
+            initial_analysis = fit_to_budget(initial_analysis, remaining * 3 // 5)
+            critique = fit_to_budget(critique, remaining - count_tokens(initial_analysis))
+            prompt = build_optimize_prompt(initial_analysis, critique)
+            compaction.append("truncated")
+    else:
+        raise ValueError(f"Unknown pipeline step: {step}")
+
+    # The budget above excludes the system prompt; report both sides including it
+    system_tokens = count_tokens(system_prompt)
+    report = {
+        "step": step,
+        "model": model,
+        "input_budget": budget + system_tokens,
+        "estimated_input_tokens": system_tokens + count_tokens(prompt),
+        "max_output_tokens": route["max_tokens"],
+        "compaction": compaction,
+    }
+    if section_keys is not None:
+        report["sections"] = section_keys
+    if compaction:
+        logging.info(f"Compacted {step} prompt to fit the token budget: {', '.join(compaction)}")
+    return prompt, report
+
+
+# Function to build a structured-mode prompt within the budget, recording any
+# compaction. Returns the prompt and the component keys it asks for.
+def _build_structured_prompt(step, canvas_text, initial_sections, critique_sections, budget, compaction,
+                             only_sections=None):
+    labels = [label for _, label in CANVAS_COMPONENTS]
+    keys = only_sections or [key for key, _ in CANVAS_COMPONENTS]
+    if step == "initial_analysis":
+        prompt = build_structured_create_prompt(canvas_text, keys)
+        if count_tokens(prompt) > budget:
+            overhead = count_tokens(build_structured_create_prompt("", keys))
+            prompt = build_structured_create_prompt(fit_to_budget(canvas_text, budget - overhead), keys)
+            compaction.append("truncated canvas")
+        return prompt, keys
+
+    if step == "critique":
+        # The whole canvas is shown so issues between components are still found
+        initial_analysis = merge_component_analyses(initial_sections)
+        prompt = build_structured_critique_prompt(initial_analysis, keys)
+        if count_tokens(prompt) > budget:
+            overhead = count_tokens(build_structured_critique_prompt("", keys))
+            keep_labels = [dict(CANVAS_COMPONENTS)[key] for key in keys]
+            initial_analysis = compact_sections(initial_analysis, labels, budget - overhead, keep_labels=keep_labels)
+            prompt = build_structured_critique_prompt(initial_analysis, keys)
+            compaction.append("compacted initial analysis")
+        return prompt, keys
+
+    if step == "optimization":
+        keys = issue_sections(critique_sections)
+        initial_analysis = merge_component_analyses({key: initial_sections.get(key, "") for key in keys})
+        critique = merge_component_analyses({key: critique_sections[key] for key in keys})
+        prompt = build_structured_optimize_prompt(initial_analysis, critique, keys)
+        if count_tokens(prompt) > budget:
+            critique = merge_component_analyses({key: extract_issues(critique_sections[key]) for key in keys})
+            prompt = build_structured_optimize_prompt(initial_analysis, critique, keys)
+            compaction.append("critique issue list")
+        if count_tokens(prompt) > budget:
+            overhead = count_tokens(build_structured_optimize_prompt("", critique, keys))
+            initial_analysis = compact_sections(initial_analysis, labels, budget - overhead)
+            prompt = build_structured_optimize_prompt(initial_analysis, critique, keys)
+            compaction.append("compacted sections")
+        if count_tokens(prompt) > budget:
+            remaining = budget - count_tokens(build_structured_optimize_prompt("", "", keys))
+            initial_analysis = fit_to_budget(initial_analysis, remaining * 3 // 5)
+            critique = fit_to_budget(critique, remaining - count_tokens(initial_analysis))
+            prompt = build_structured_optimize_prompt(initial_analysis, critique, keys)
+            compaction.append("truncated")
+        return prompt, keys
+
+    raise ValueError(f"Unknown pipeline step: {step}")
+
+
+# Function to list the components a structured critique found issues with
+def issue_sections(critique_sections):
+    return [key for key, _ in CANVAS_COMPONENTS if (critique_sections.get(key) or "").strip()]
+
+
+# Function to run one GROQ completion, going through the shared completion cache.
+# on_chunk is called with each new piece of text as it streams in (a cache hit
+# arrives as a single piece). If a stats dict is given it is filled with the
+# actual token usage reported by GROQ and the timings of the call; every call is
+# also recorded in the process-wide completion metrics. Errors are raised to the caller.
+# A route (see model_routing.get_step_route) picks the model, temperature and
+# fallback model. The fallback serves the request when the primary model has
+# recently been slow, or when it fails or exceeds fallback_after_seconds
+# before any text arrived. stats["model"] is the model that answered.
+def generate_completion(api_key, prompt, system_prompt=SYSTEM_PROMPT, use_cache=True, on_chunk=None,
+                        max_tokens=1024, stats=None, route=None):
+    route = route or {"model": DEFAULT_MODEL, "temperature": 1, "fallback_model": None}
+    model = route["model"]
+    fallback_model = route.get("fallback_model")
+    if fallback_model == model:
+        fallback_model = None
+    params = {"temperature": route["temperature"], "max_tokens": max_tokens, "top_p": 1, "stop": None}
+    if stats is None:
+        stats = {}
+    stats.update(model=model, from_cache=False, prompt_chars=len(system_prompt) + len(prompt))
+    started = time.perf_counter()
+    cache = get_completion_cache()
+    # Responses are cached under the model that answered, so a fallback answer
+    # is never served for a request to the primary model
+    cache_key = cache.make_key(model, system_prompt, prompt, **params)
+
+    try:
+        if use_cache:
+            cached_entry = cache.get_entry(cache_key)
+            if cached_entry is not None:
+                cached_model, cached_response = cached_entry
+                stats.update(model=cached_model, from_cache=True)
+                stats["ttft_seconds"] = time.perf_counter() - started
+                if on_chunk is not None:
+                    on_chunk(cached_response)
+                stats.update(chunks=1, completion_chars=len(cached_response),
+                             duration_seconds=time.perf_counter() - started)
+                logging.info("Served GROQ completion from cache")
+                return cached_response
+
+        client = get_groq_client(api_key)
+        if fallback_model and is_model_slow(model, route["fallback_after_seconds"], get_metrics().recent()):
+            stats.update(model=fallback_model, requested_model=model, fallback_reason=SLOW_MODEL_REASON)
+            logging.info(f"Routing to {fallback_model}, {model} has recently been slow")
+            model, fallback_model = fallback_model, None
+        messages = [
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+        estimated_tokens = count_tokens(system_prompt) + count_tokens(prompt) + max_tokens
+        # GROQ quotas are per model
+        limiter = get_rate_limiter(api_key, model)
+
+        parts = []
+        usage = None
+        first_token_at = None
+        render_seconds = 0.0
+        retries = 0
+        stats["queue_wait_seconds"] = 0.0
+        while True:
+            # A retry after a broken stream asks the model to continue the text
+            # already passed to on_chunk, so nothing is rendered twice
+            attempt_messages, attempt_params = messages, params
+            if parts:
+                streamed = "".join(parts)
+                attempt_messages = messages + [{"role": "assistant", "content": streamed}]
+                attempt_params = dict(params, max_tokens=max(1, max_tokens - count_tokens(streamed)))
+            stats["queue_wait_seconds"] += limiter.acquire(estimated_tokens)
+            request_started = time.perf_counter()
+            try:
+                if fallback_model and not parts:
+                    # Give up on a slow primary model while the fallback can still take over
+                    attempt_params = dict(attempt_params, timeout=route["fallback_after_seconds"])
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=attempt_messages,
+                    stream=True,
+                    **attempt_params
+                )
+                for chunk in completion:
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                                stats["ttft_seconds"] = first_token_at - request_started
+                            parts.append(delta)
+                            if on_chunk is not None:
+                                render_started = time.perf_counter()
+                                on_chunk(delta)
+                                render_seconds += time.perf_counter() - render_started
+                    # GROQ reports token usage on the final chunk
+                    x_groq = getattr(chunk, "x_groq", None)
+                    usage = getattr(x_groq, "usage", None) or getattr(chunk, "usage", None) or usage
+            except RETRYABLE_ERRORS as e:
+                retry_after = _retry_after(e)
+                rate_limited = isinstance(e, RateLimitError)
+                limiter.release(estimated_tokens, rate_limited=rate_limited, retry_after=retry_after)
+                if rate_limited:
+                    stats["rate_limited"] = stats.get("rate_limited", 0) + 1
+                fallback_reason = next((reason for error_type, reason in FALLBACK_ERRORS.items()
+                                        if isinstance(e, error_type)), None)
+                if fallback_model and not parts and fallback_reason:
+                    logging.warning(f"GROQ model {model} {fallback_reason} ({str(e)}), falling back to {fallback_model}")
+                    stats.update(model=fallback_model, requested_model=model, fallback_reason=fallback_reason)
+                    model, fallback_model = fallback_model, None
+                    limiter = get_rate_limiter(api_key, model)
+                    continue
+                if retries >= get_max_retries():
+                    raise
+                delay = backoff_delay(retries, retry_after)
+                retries += 1
+                stats["retries"] = retries
+                logging.warning(f"GROQ request failed ({str(e)}), retry {retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            except Exception:
+                limiter.release(estimated_tokens)
+                raise
+            actual_tokens = usage.prompt_tokens + usage.completion_tokens if usage is not None else estimated_tokens
+            limiter.release(estimated_tokens, actual_tokens=actual_tokens)
+            break
+        finished_at = time.perf_counter()
+        response = "".join(parts)
+
+        stats.update(model=model, chunks=len(parts), completion_chars=len(response), render_seconds=render_seconds,
+                     duration_seconds=finished_at - started)
+        if usage is not None:
+            stats["prompt_tokens"] = usage.prompt_tokens
+            stats["completion_tokens"] = usage.completion_tokens
+        completion_tokens = stats.get("completion_tokens", count_tokens(response))
+        # Throughput of the model and network only, rendering time excluded
+        generation_seconds = finished_at - (first_token_at or finished_at) - render_seconds
+        if generation_seconds > 0:
+            stats["tokens_per_second"] = completion_tokens / generation_seconds
+
+        # Only complete responses are cached; a bypassed run refreshes the entry
+        cache.put(cache.make_key(model, system_prompt, prompt, **params), model, response)
+        logging.info("Successfully generated GROQ completion")
+        return response
+    except Exception as e:
+        stats.update(error=str(e), duration_seconds=time.perf_counter() - started)
+        raise
+    finally:
+        get_metrics().record(stats)
+
+
+# Function to read the Retry-After seconds of a rate-limit response, if any
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# Function to analyze all canvas components as independent, concurrent requests.
+# Yields (key, delta, None) as text streams in and (key, None, result) once a
+# component is finished, where result is the full response or the exception it
+# raised. Events are yielded in the calling thread, so a Streamlit script can
+# render them directly. If component_stats is given it is filled with the
+# completion stats of each component. keys limits the analysis to some components.
+def iter_component_analyses(api_key, business_model_data, use_cache=True, max_workers=None, component_stats=None,
+                            keys=None):
+    canvas_text = build_canvas_text(business_model_data)
+    components = [(key, label) for key, label in CANVAS_COMPONENTS if keys is None or key in keys]
+    events = queue.Queue()
+    route = get_step_route("initial_analysis")
+    if component_stats is None:
+        component_stats = {}
+
+    def analyze(key, label):
+        component_stats[key] = {"step": f"initial_analysis:{key}"}
+        try:
+            response = generate_completion(
+                api_key, build_component_prompt(canvas_text, label), use_cache=use_cache,
+                on_chunk=lambda delta: events.put((key, delta, None)),
+                max_tokens=route["max_tokens"], stats=component_stats[key], route=route
+            )
+            events.put((key, None, response))
+        except Exception as e:
+            events.put((key, None, e))
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(components)) as executor:
+        for key, label in components:
+            executor.submit(analyze, key, label)
+        remaining = len(components)
+        while remaining:
+            event = events.get()
+            if event[1] is None:
+                remaining -= 1
+            yield event
+
+
+# Function to run Step 1 as parallel per-component requests and merge the results
+# on_chunk, if given, is called with (component key, delta) as text arrives.
+# If an analyses dict is given it is filled with the result of each component.
+# keys limits the analysis to some components.
+def generate_component_analysis(api_key, business_model_data, use_cache=True, on_chunk=None, component_stats=None,
+                                analyses=None, keys=None):
+    if analyses is None:
+        analyses = {}
+    for key, delta, result in iter_component_analyses(api_key, business_model_data, use_cache,
+                                                      component_stats=component_stats, keys=keys):
+        if isinstance(result, Exception):
+            raise result
+        if result is not None:
+            analyses[key] = result
+        elif on_chunk is not None:
+            on_chunk(key, delta)
+    return merge_component_analyses(analyses)
+
+
+# The pipeline as a small dependency graph: each step and the steps whose
+# output it consumes. Step 1 consumes the canvas itself. run_pipeline builds
+# each step's memo inputs from the outputs listed here.
+PIPELINE_STEPS = {
+    "initial_analysis": (),
+    "critique": ("initial_analysis",),
+    "optimization": ("initial_analysis", "critique"),
+}
+
+# The canvas as a dependency graph: each component and the components whose
+# analysis builds on it. When a component changes, these are re-evaluated too.
+COMPONENT_DEPENDENTS = {
+    "value_proposition": ("customer_profile", "revenue_streams"),
+    "customer_profile": ("value_proposition", "distribution_channel", "customer_relationship", "revenue_streams"),
+    "distribution_channel": ("customer_relationship", "cost_structure"),
+    "customer_relationship": ("cost_structure",),
+    "revenue_streams": (),
+    "key_resources": ("key_activities", "cost_structure"),
+    "key_activities": ("cost_structure",),
+    "key_partners": ("key_resources", "key_activities", "cost_structure"),
+    "cost_structure": (),
+}
+
+
+# Function to list the canvas components whose text differs between two canvases
+def changed_components(previous_data, business_model_data):
+    return [key for key, _ in CANVAS_COMPONENTS
+            if (previous_data.get(key) or "").strip() != (business_model_data.get(key) or "").strip()]
+
+
+# Function to list the components to re-evaluate after some changed: the
+# changed ones and their direct dependents, in canvas order
+def affected_components(changed):
+    affected = set(changed)
+    for key in changed:
+        affected.update(COMPONENT_DEPENDENTS[key])
+    return [key for key, _ in CANVAS_COMPONENTS if key in affected]
+
+
+# Function to check that a previous evaluation has the per-component sections
+# an incremental re-evaluation splices into
+def has_complete_sections(sections):
+    keys = {key for key, _ in CANVAS_COMPONENTS}
+    return (bool(sections) and sections.get("critique") is not None
+            and all(keys <= set(sections.get(step) or {}) for step in ("initial_analysis", "optimization")))
+
+
+# Function to hash everything a step's output depends on
+def step_input_key(step, inputs):
+    payload = json.dumps([step, get_step_route(step), SYSTEM_PROMPT, inputs])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Function to run one pipeline step through a step memo.
+# The memo maps a step name to the hash of its inputs and the output produced
+# from them. When the hash is unchanged the stored output is returned without
+# calling GROQ; failed steps (None output) are never recorded, so the next run
+# resumes from the first step that did not complete.
+# Returns the output and whether it was reused.
+def run_memoized_step(memo, step, inputs, compute, use_memo=True):
+    key = step_input_key(step, inputs)
+    entry = memo.get(step)
+    if use_memo and entry is not None and entry["key"] == key:
+        logging.info(f"Reused output of pipeline step {step}, inputs unchanged")
+        return entry["output"], True
+    output = compute()
+    if output is not None:
+        memo[step] = {"key": key, "output": output}
+    return output, False
+
+
+# Function to stream a structured response: text of each canvas section is
+# passed to on_chunk(delta, component) as the parser decodes it. Once the
+# response turns out not to be valid JSON the text received so far is passed
+# on as prose (component None), and so is everything after it.
+# Returns the parser and the callback for generate_completion.
+def _stream_sections(on_chunk):
+    parser = StreamingSectionParser()
+    received = []
+
+    def feed(delta):
+        received.append(delta)
+        if parser.failed:
+            if on_chunk is not None:
+                on_chunk(delta, None)
+            return
+        events = parser.feed(delta)
+        if on_chunk is None:
+            return
+        for kind, key, text in events:
+            if kind == "text":
+                on_chunk(text, key)
+        if parser.failed:
+            on_chunk("".join(received), None)
+
+    return parser, feed
+
+
+# Function to run the full create -> critique -> optimize pipeline without a UI.
+# Passing the same memo to a retry skips the steps that already completed.
+# Optional callbacks report progress: on_chunk(step, delta, component) for
+# streamed text (component is set for parallel Step 1 analyses and for the
+# sections of structured output) and on_step(step, output, reused, token_report,
+# sections, refreshed) when a step finishes.
+# With structured=True each step answers per canvas component (see
+# build_step_prompt); a response that cannot be parsed is kept as prose and the
+# steps after it use the prose prompts. The parsed sections of each step are
+# returned under "sections" (None for prose), the model that served each step
+# under "models".
+# previous is an earlier structured evaluation of this canvas:
+# {"business_model_data": ..., "sections": {step: sections}}. Only the
+# components that changed since then, and their dependents, are re-evaluated;
+# the new sections are spliced into the previous ones. The components each step
+# refreshed are returned under "refreshed" (empty for a full evaluation).
+# When a refresh cannot be parsed the step is evaluated in full, after
+# on_reset(step) so the caller can drop the text already streamed for it.
+def run_pipeline(api_key, business_model_data, use_cache=True, fan_out=False, memo=None,
+                 on_chunk=None, on_step=None, structured=False, previous=None, on_reset=None):
+    if memo is None:
+        memo = {}
+    canvas_text = build_canvas_text(business_model_data)
+    outputs = {}
+    token_usage = {}
+    models = {}
+    sections = {}
+    refreshed = {}
+
+    # Components to refresh, or None for a full evaluation. A bypassed cache
+    # asks for fresh results, so it always evaluates in full.
+    refresh = None
+    if structured and use_cache and previous is not None and has_complete_sections(previous.get("sections")):
+        changed = changed_components(previous["business_model_data"], business_model_data)
+        affected = affected_components(changed)
+        if len(affected) < len(CANVAS_COMPONENTS):
+            refresh = affected
+            logging.info(f"Incremental evaluation: {len(changed)} components changed, "
+                         f"re-evaluating {len(affected)} of {len(CANVAS_COMPONENTS)}")
+
+    def stream_to(step):
+        if on_chunk is None:
+            return None
+        return lambda delta: on_chunk(step, delta, None)
+
+    def complete(step, **prompt_inputs):
+        prompt, report = build_step_prompt(step, **prompt_inputs)
+        parser = None
+        stream = stream_to(step)
+        if "sections" in report:
+            parser, stream = _stream_sections(
+                None if on_chunk is None else lambda delta, key: on_chunk(step, delta, key)
+            )
+        response = generate_completion(api_key, prompt, use_cache=use_cache, on_chunk=stream,
+                                       max_tokens=report["max_output_tokens"], stats=report,
+                                       route=get_step_route(step))
+        token_usage[step] = report
+        models[step] = report["model"]
+        if parser is not None:
+            sections[step] = parser.result(report["sections"])
+            if sections[step] is None:
+                logging.warning(f"Could not parse structured output of {step} "
+                                f"({parser.error or 'no sections found'}), using it as prose")
+                report["prose_fallback"] = True
+            else:
+                response = merge_component_analyses(sections[step])
+        return response
+
+    # Function to splice refreshed sections into the previous ones; components
+    # missing from a cut-off response keep their previous text
+    def splice(step, new_sections, refreshed_keys, base=None):
+        spliced = dict(previous["sections"][step] if base is None else base)
+        spliced.update(new_sections)
+        sections[step] = spliced
+        refreshed[step] = [key for key in refreshed_keys if key in new_sections]
+        return merge_component_analyses(spliced)
+
+    # Function to give up on an incremental evaluation whose response could not
+    # be parsed; this step and the ones after it are evaluated in full
+    def abandon_refresh(step):
+        nonlocal refresh
+        logging.warning(f"Could not refresh sections of {step}, evaluating it in full")
+        refresh = None
+        if on_reset is not None:
+            on_reset(step)
+
+    # Step 1 as parallel per-component requests. Each component's completion is
+    # reported in token_usage under "initial_analysis:<key>".
+    def analyze_components(analyses, keys=None):
+        component_chunk = None
+        if on_chunk is not None:
+            component_chunk = lambda key, delta: on_chunk("initial_analysis", delta, key)
+        component_stats = {}
+        analysis = generate_component_analysis(api_key, business_model_data, use_cache, on_chunk=component_chunk,
+                                               component_stats=component_stats, analyses=analyses, keys=keys)
+        token_usage.update({stats["step"]: stats for stats in component_stats.values()})
+        models["initial_analysis"] = ", ".join(sorted({stats["model"] for stats in component_stats.values()}))
+        return analysis
+
+    def create():
+        if refresh is not None:
+            new_sections = {}
+            if fan_out and refresh:
+                analyze_components(new_sections, keys=refresh)
+            elif refresh:
+                complete("initial_analysis", canvas_text=canvas_text, structured=True, only_sections=refresh)
+                new_sections = sections["initial_analysis"]
+            if new_sections is not None:
+                return splice("initial_analysis", new_sections, refresh)
+            abandon_refresh("initial_analysis")
+        if fan_out:
+            analyses = {}
+            analysis = analyze_components(analyses)
+            # Parallel analyses are sections already
+            sections["initial_analysis"] = analyses
+            return analysis
+        return complete("initial_analysis", canvas_text=canvas_text, structured=structured)
+
+    def critique_step():
+        initial_sections = sections.get("initial_analysis")
+        if refresh is not None and initial_sections:
+            new_sections = {}
+            if refresh:
+                complete("critique", structured=True, initial_sections=initial_sections, only_sections=refresh)
+                new_sections = sections["critique"]
+            if new_sections is not None:
+                return splice("critique", new_sections, refresh)
+            abandon_refresh("critique")
+        return complete("critique", initial_analysis=outputs["initial_analysis"],
+                        structured=structured and bool(initial_sections), initial_sections=initial_sections)
+
+    def optimize():
+        initial_sections = sections.get("initial_analysis")
+        critique_sections = sections.get("critique")
+        if refresh is not None and initial_sections and critique_sections:
+            base = dict(previous["sections"]["optimization"])
+            # Refreshed components without issues take their new initial analysis
+            no_issues = [key for key in refresh if not (critique_sections.get(key) or "").strip()]
+            base.update({key: initial_sections[key] for key in no_issues})
+            with_issues = [key for key in issue_sections(critique_sections) if key in refresh]
+            new_sections = {}
+            if with_issues:
+                complete("optimization", structured=True, initial_sections=initial_sections,
+                         critique_sections={key: critique_sections[key] for key in with_issues})
+                new_sections = sections["optimization"]
+            if new_sections is not None:
+                spliced = splice("optimization", new_sections, with_issues, base)
+                refreshed["optimization"] = [key for key in refresh
+                                             if key in no_issues or key in refreshed["optimization"]]
+                return spliced
+            abandon_refresh("optimization")
+        if not (structured and initial_sections and critique_sections):
+            return complete("optimization", initial_analysis=outputs["initial_analysis"], critique=outputs["critique"])
+        if not issue_sections(critique_sections):
+            # Nothing to address: the initial sections stand as they are
+            logging.info("Critique found no issues, optimization reuses the initial analysis")
+            sections["optimization"] = dict(initial_sections)
+            return merge_component_analyses(initial_sections)
+        response = complete("optimization", structured=True, initial_sections=initial_sections,
+                            critique_sections=critique_sections)
+        if sections["optimization"] is None:
+            return response
+        # Sections without issues, or missing from a cut-off response, keep their initial text
+        optimized = dict(initial_sections)
+        optimized.update(sections["optimization"])
+        sections["optimization"] = optimized
+        return merge_component_analyses(optimized)
+
+    # Memo inputs of a step: the outputs of the steps it depends on, then its own settings
+    def run_step(step, compute, *settings):
+        inputs = [outputs[dependency] for dependency in PIPELINE_STEPS[step]] + list(settings) + [structured]
+        # Bypassing the cache also re-runs memoized steps
+        output, reused = run_memoized_step(memo, step, inputs, compute, use_memo=use_cache)
+        # The memo remembers which model produced a reused output and its sections
+        if reused:
+            models[step] = memo[step].get("model")
+            sections[step] = memo[step].get("sections")
+        elif output is not None:
+            memo[step]["model"] = models.get(step)
+            memo[step]["sections"] = sections.get(step)
+        if on_step is not None:
+            on_step(step, output, reused, token_usage.get(step), sections.get(step), refreshed.get(step))
+        outputs[step] = output
+
+    run_step("initial_analysis", create, canvas_text, fan_out)
+    run_step("critique", critique_step)
+    run_step("optimization", optimize)
+    return {
+        "initial_analysis": outputs["initial_analysis"],
+        "critique": outputs["critique"],
+        "optimization": outputs["optimization"],
+        "token_usage": token_usage,
+        "models": models,
+        "sections": sections,
+        "refreshed": refreshed,
+    }
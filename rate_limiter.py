@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+
+# Quotas of the GROQ account, overridable through the environment (.env)
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_TOKENS_PER_MINUTE = 30000
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_CAP = 60.0
+# Successful requests needed before one more concurrent request is allowed
+SUCCESSES_PER_INCREASE = 5
+
+
+# Function to compute how long to wait before retry number `attempt` (0-based).
+# Uses "full jitter" exponential backoff; a Retry-After from the server is a
+# lower bound, with a little jitter added so waiting callers do not all retry at once.
+def backoff_delay(attempt, retry_after=None, base=DEFAULT_BACKOFF_BASE, cap=DEFAULT_BACKOFF_CAP):
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, base)
+    return delay
+
+
+# Token-bucket limiter shared by every session and worker thread using one key.
+# Requests wait until the requests-per-minute and tokens-per-minute buckets
+# both have room and fewer than `concurrency_limit` requests are in flight.
+# The concurrency limit adapts to the server: it halves on every 429 and grows
+# by one after a run of successes (additive increase, multiplicative decrease),
+# and a 429's Retry-After pauses all callers, not just the one that got it.
+class RateLimiter:
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = max_concurrency
+        self._request_tokens = float(requests_per_minute)
+        self._token_tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._waiting = 0
+        self._successes = 0
+        self._counters = {"acquired": 0, "rate_limited": 0, "wait_seconds": 0.0}
+        self._condition = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._request_tokens = min(self.requests_per_minute,
+                                   self._request_tokens + elapsed * self.requests_per_minute / 60)
+        self._token_tokens = min(self.tokens_per_minute,
+                                 self._token_tokens + elapsed * self.tokens_per_minute / 60)
+
+    # Seconds until a request needing `tokens` may start, 0 if it may start now
+    def _time_until_ready(self, tokens, now):
+        waits = [self._paused_until - now]
+        if self._request_tokens < 1:
+            waits.append((1 - self._request_tokens) * 60 / self.requests_per_minute)
+        # A request larger than the whole bucket only waits for a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        if self._token_tokens < tokens:
+            waits.append((tokens - self._token_tokens) * 60 / self.tokens_per_minute)
+        return max(waits)
+
+    # Function to wait for room for one request of an estimated size.
+    # Returns the number of seconds spent waiting.
+    def acquire(self, estimated_tokens):
+        started = time.monotonic()
+        with self._condition:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._in_flight < self.concurrency_limit:
+                        wait = self._time_until_ready(estimated_tokens, now)
+                        if wait <= 0:
+                            break
+                        self._condition.wait(wait)
+                    else:
+                        # Woken by release()
+                        self._condition.wait()
+                self._request_tokens -= 1
+                self._token_tokens -= estimated_tokens
+                self._in_flight += 1
+                waited = time.monotonic() - started
+                self._counters["acquired"] += 1
+                self._counters["wait_seconds"] += waited
+                return waited
+            finally:
+                self._waiting -= 1
+
+    # Function to end a request started with acquire(). When the actual token
+    # count is known the difference to the estimate is settled with the bucket.
+    def release(self, estimated_tokens, actual_tokens=None, rate_limited=False, retry_after=None):
+        with self._condition:
+            self._in_flight -= 1
+            if actual_tokens is not None:
+                self._token_tokens += estimated_tokens - actual_tokens
+            if rate_limited:
+                self._counters["rate_limited"] += 1
+                self._successes = 0
+                self.concurrency_limit = max(1, self.concurrency_limit // 2)
+                pause = retry_after if retry_after is not None else DEFAULT_BACKOFF_BASE
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                logging.warning(f"GROQ rate limit hit, concurrency limit now {self.concurrency_limit}, "
+                                f"pausing requests for {pause:.1f}s")
+            elif actual_tokens is not None:
+                self._successes += 1
+                if self._successes >= SUCCESSES_PER_INCREASE and self.concurrency_limit < self.max_concurrency:
+                    self._successes = 0
+                    self.concurrency_limit += 1
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            self._refill(time.monotonic())
+            return dict(
+                self._counters,
+                in_flight=self._in_flight,
+                waiting=self._waiting,
+                concurrency_limit=self.concurrency_limit,
+                requests_available=round(self._request_tokens, 2),
+                tokens_available=round(self._token_tokens),
+            )
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+# Process-wide limiter per API key and model: GROQ quotas belong to the account
+# and apply to each model separately, so every session using the same key and
+# model shares one limiter
+def get_rate_limiter(api_key, model=None):
+    fingerprint = (hashlib.sha256(api_key.encode('utf-8')).hexdigest(), model)
+    with _limiters_lock:
+        limiter = _limiters.get(fingerprint)
+        if limiter is None:
+            limiter = RateLimiter(
+                requests_per_minute=int(os.getenv('GROQ_REQUESTS_PER_MINUTE', DEFAULT_REQUESTS_PER_MINUTE)),
+                tokens_per_minute=int(os.getenv('GROQ_TOKENS_PER_MINUTE', DEFAULT_TOKENS_PER_MINUTE)),
+                max_concurrency=int(os.getenv('GROQ_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY))
+            )
+            _limiters[fingerprint] = limiter
+        return limiter
+
+
+# Function to sum the limiter stats of every key, for the metrics views
+def rate_limiter_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    totals = {}
+    for limiter in limiters:
+        for name, value in limiter.stats().items():
+            totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def get_max_retries():
+    return int(os.getenv('GROQ_MAX_RETRIES', DEFAULT_MAX_RETRIES))
@@ -0,0 +1,254 @@
+import collections
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from pathlib import Path
+
+DEFAULT_SESSION_DIR = 'session_state'
+# Seconds without activity before a session's payloads are dropped from memory
+DEFAULT_IDLE_TTL = 1800
+# Days before the files of a session nobody returned to are deleted
+DEFAULT_RETENTION_DAYS = 7
+# Decompressed payloads kept in memory across all sessions
+DEFAULT_MAX_MEMORY_MB = 64
+# Seconds between sweeps for idle sessions and for expired files
+SWEEP_INTERVAL = 60
+DISK_SWEEP_INTERVAL = 3600
+
+PAYLOAD_SUFFIX = ".json.z"
+_SESSION_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+# Function to check a session ID before it is used as a folder name
+def is_valid_session_id(session_id):
+    return isinstance(session_id, str) and bool(_SESSION_ID_PATTERN.match(session_id))
+
+
+# Disk-backed store for the large values of Streamlit sessions (analyses,
+# step memos), so st.session_state only keeps a session ID.
+# Each value is saved as zlib-compressed JSON under <directory>/<session>/<name>.json.z.
+# Recently used values stay in memory up to max_memory_bytes across all
+# sessions, least recently used first out. A session idle for idle_ttl seconds
+# is dropped from memory entirely and read back from disk when it is next used.
+# Files of sessions idle for longer than retention_seconds are deleted.
+# Values returned by get() are shared with the store: change them through put().
+class SessionStore:
+    def __init__(self, directory=DEFAULT_SESSION_DIR, idle_ttl=DEFAULT_IDLE_TTL,
+                 retention_seconds=DEFAULT_RETENTION_DAYS * 24 * 3600, max_memory_bytes=DEFAULT_MAX_MEMORY_MB * 1024 * 1024):
+        self.directory = Path(directory)
+        self.idle_ttl = idle_ttl
+        self.retention_seconds = retention_seconds
+        self.max_memory_bytes = max_memory_bytes
+        # session ID -> {"last_seen": time, "payloads": {name: {"size": bytes, "stored_size": bytes}}}
+        self._sessions = {}
+        # (session ID, name) -> (value, size), least recently used first
+        self._memory = collections.OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._disk_files = 0
+        self._counters = {"writes": 0, "rehydrated": 0, "evicted_sessions": 0, "evicted_payloads": 0,
+                          "deleted_sessions": 0}
+        self._swept_at = time.time()
+        self._disk_swept_at = 0.0
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._sweep_disk(time.time())
+
+    def _payload_path(self, session_id, name):
+        return self.directory / session_id / f"{name}{PAYLOAD_SUFFIX}"
+
+    # Handles of a session, read from its folder when it is not in memory
+    def _session(self, session_id, now):
+        session = self._sessions.get(session_id)
+        if session is None:
+            payloads = {}
+            folder = self.directory / session_id
+            if folder.is_dir():
+                for path in folder.glob(f"*{PAYLOAD_SUFFIX}"):
+                    payloads[path.name[:-len(PAYLOAD_SUFFIX)]] = {"size": None, "stored_size": path.stat().st_size}
+            session = self._sessions[session_id] = {"last_seen": now, "payloads": payloads}
+        session["last_seen"] = now
+        return session
+
+    def _remember(self, key, value, size):
+        self._forget(key)
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+        # Values stay on disk, so dropping them from memory loses nothing
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, (_, dropped_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= dropped_size
+            self._counters["evicted_payloads"] += 1
+
+    def _forget(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[1]
+
+    # Function to store a value of a session; None deletes it
+    def put(self, session_id, name, value):
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session ID: {session_id!r}")
+        if value is None:
+            self.delete(session_id, name)
+            return
+        data = json.dumps(value).encode('utf-8')
+        compressed = zlib.compress(data)
+        path = self._payload_path(session_id, name)
+        with self._lock:
+            now = time.time()
+            session = self._session(session_id, now)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_name(path.name + ".tmp")
+            with open(temp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(temp_path, path)
+            previous = session["payloads"].get(name)
+            if previous is None:
+                self._disk_files += 1
+            else:
+                self._disk_bytes -= previous["stored_size"]
+            self._disk_bytes += len(compressed)
+            session["payloads"][name] = {"size": len(data), "stored_size": len(compressed)}
+            self._counters["writes"] += 1
+            self._remember((session_id, name), value, len(data))
+            self._maybe_sweep(now)
+
+    # Function to read a value of a session, from memory or else from disk
+    def get(self, session_id, name, default=None):
+        if not is_valid_session_id(session_id):
+            return default
+        key = (session_id, name)
+        with self._lock:
+            now = time.time()
+            session = self._session(session_id, now)
+            self._maybe_sweep(now)
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key][0]
+            if name not in session["payloads"]:
+                return default
+            try:
+                with open(self._payload_path(session_id, name), 'rb') as f:
+                    data = zlib.decompress(f.read())
+                value = json.loads(data)
+            except (OSError, zlib.error, ValueError) as e:
+                logging.error(f"Could not read session value {name}: {str(e)}")
+                return default
+            session["payloads"][name]["size"] = len(data)
+            self._counters["rehydrated"] += 1
+            self._remember(key, value, len(data))
+            return value
+
+    def delete(self, session_id, name):
+        if not is_valid_session_id(session_id):
+            return
+        with self._lock:
+            session = self._session(session_id, time.time())
+            self._forget((session_id, name))
+            handle = session["payloads"].pop(name, None)
+            if handle is None:
+                return
+            try:
+                os.remove(self._payload_path(session_id, name))
+            except FileNotFoundError:
+                pass
+            self._disk_bytes -= handle["stored_size"]
+            self._disk_files -= 1
+
+    def _maybe_sweep(self, now):
+        if now - self._swept_at >= min(SWEEP_INTERVAL, self.idle_ttl):
+            self._swept_at = now
+            self._evict_idle(now)
+        if now - self._disk_swept_at >= DISK_SWEEP_INTERVAL:
+            self._sweep_disk(now)
+
+    # Drop sessions idle for longer than the TTL from memory; their files stay
+    def _evict_idle(self, now):
+        idle = [session_id for session_id, session in self._sessions.items()
+                if now - session["last_seen"] > self.idle_ttl]
+        for session_id in idle:
+            for name in self._sessions.pop(session_id)["payloads"]:
+                self._forget((session_id, name))
+        if idle:
+            self._counters["evicted_sessions"] += len(idle)
+            logging.info(f"Moved {len(idle)} idle sessions out of memory")
+
+    # Delete the folders of sessions not used within the retention period and
+    # recount what is left on disk
+    def _sweep_disk(self, now):
+        self._disk_swept_at = now
+        disk_bytes = disk_files = deleted = 0
+        for folder in self.directory.iterdir():
+            if not folder.is_dir():
+                continue
+            paths = list(folder.glob(f"*{PAYLOAD_SUFFIX}"))
+            last_used = max((path.stat().st_mtime for path in paths), default=0)
+            if folder.name not in self._sessions and now - last_used > self.retention_seconds:
+                shutil.rmtree(folder, ignore_errors=True)
+                deleted += 1
+                continue
+            disk_files += len(paths)
+            disk_bytes += sum(path.stat().st_size for path in paths)
+        self._disk_bytes, self._disk_files = disk_bytes, disk_files
+        if deleted:
+            self._counters["deleted_sessions"] += deleted
+            logging.info(f"Deleted stored state of {deleted} sessions unused for "
+                         f"{self.retention_seconds // 86400} days")
+
+    # Memory and disk usage of one session
+    def session_stats(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id, {"payloads": {}})
+            memory_bytes = sum(size for (owner, _), (_, size) in self._memory.items() if owner == session_id)
+            return {
+                "payloads": len(session["payloads"]),
+                "memory_bytes": memory_bytes,
+                "disk_bytes": sum(handle["stored_size"] for handle in session["payloads"].values()),
+                "size_bytes": sum(handle["size"] or 0 for handle in session["payloads"].values()),
+            }
+
+    # Memory and disk usage across all sessions
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._counters,
+                sessions_in_memory=len(self._sessions),
+                payloads_in_memory=len(self._memory),
+                memory_bytes=self._memory_bytes,
+                max_memory_bytes=self.max_memory_bytes,
+                disk_bytes=self._disk_bytes,
+                disk_files=self._disk_files,
+            )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Process-wide session store shared by all sessions.
+# Limits can be overridden through the environment (.env).
+def get_session_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore(
+                directory=os.getenv('SESSION_STATE_DIR', DEFAULT_SESSION_DIR),
+                idle_ttl=int(os.getenv('SESSION_IDLE_TTL', DEFAULT_IDLE_TTL)),
+                retention_seconds=int(os.getenv('SESSION_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)) * 24 * 3600,
+                max_memory_bytes=int(os.getenv('SESSION_MAX_MEMORY_MB', DEFAULT_MAX_MEMORY_MB)) * 1024 * 1024
+            )
+        return _store
+
+
+# Function to get the store's stats for the metrics views, empty when no
+# session has stored anything in this process
+def session_store_stats():
+    with _store_lock:
+        store = _store
+    return store.stats() if store is not None else {}
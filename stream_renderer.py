@@ -0,0 +1,69 @@
+import os
+
+# Redraws per second of views showing streamed text (STREAM_MAX_FPS in .env)
+DEFAULT_MAX_FPS = 10.0
+
+# Characters whose formatting depends on the character after them
+_BREAK_MARKERS = {
+    ".": ".\n",
+    "•": "\n• ",
+}
+
+
+# Function to format GROQ output
+def format_output(text):
+    # Add proper line breaks and formatting
+    formatted_text = text.replace(". ", ".\n")
+    formatted_text = formatted_text.replace("• ", "\n• ")
+    return formatted_text
+
+
+# Incremental version of format_output.
+# Only the newly streamed tail is formatted; a trailing "." or "•" is held back
+# until the next character shows whether it starts a ". " or "• " break.
+# The joined result always equals format_output(all text fed so far).
+class IncrementalFormatter:
+    def __init__(self):
+        self._parts = []
+        self._pending = ""
+
+    def feed(self, delta):
+        if not delta:
+            return
+        text = self._pending + delta
+        self._pending = ""
+        if text[-1] in _BREAK_MARKERS:
+            text, self._pending = text[:-1], text[-1]
+        self._parts.append(self._format(text))
+
+    def _format(self, text):
+        out = []
+        start = 0
+        index = 0
+        length = len(text)
+        while index < length - 1:
+            char = text[index]
+            if char in _BREAK_MARKERS and text[index + 1] == " ":
+                out.append(text[start:index])
+                out.append(_BREAK_MARKERS[char])
+                index += 2
+                start = index
+            else:
+                index += 1
+        out.append(text[start:])
+        return "".join(out)
+
+    # Formatted text so far, including any held-back character as-is
+    def text(self):
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        joined = self._parts[0] if self._parts else ""
+        return joined + self._pending
+
+
+
+# Function to get the seconds between redraws of streamed text, at most
+# STREAM_MAX_FPS per second. Views poll the running job at this interval.
+def stream_refresh_interval():
+    max_fps = float(os.getenv('STREAM_MAX_FPS', DEFAULT_MAX_FPS))
+    return 1.0 / (max_fps if max_fps > 0 else DEFAULT_MAX_FPS)
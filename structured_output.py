@@ -0,0 +1,161 @@
+# Characters skipped looking for the opening brace before the response is taken to be prose
+MAX_PREAMBLE_CHARS = 200
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+# Parser states
+_BEFORE_OBJECT = "before_object"
+_BEFORE_KEY = "before_key"
+_IN_KEY = "in_key"
+_BEFORE_COLON = "before_colon"
+_BEFORE_VALUE = "before_value"
+_IN_VALUE = "in_value"
+_AFTER_VALUE = "after_value"
+_DONE = "done"
+_FAILED = "failed"
+
+
+# Incremental parser for a streamed JSON object of string values, such as
+# {"value_proposition": "...", "customer_profile": "..."}.
+# feed() takes each streamed delta and returns the events it completes:
+#   ("text", key, text)   decoded text added to the value of `key`
+#   ("close", key, value) the value of `key` is complete
+# A short preamble before the opening brace (a code fence, a sentence) and
+# anything after the closing brace are skipped. Values that are not strings, or any other syntax
+# error, stop the parser and set `failed`; the caller then treats the response
+# as prose. Raw newlines inside strings are accepted, as models often emit them.
+class StreamingSectionParser:
+    def __init__(self):
+        self.state = _BEFORE_OBJECT
+        self.sections = {}
+        self.error = None
+        self._skipped = 0
+        self._key = []
+        self._value = []
+        self._current_key = None
+        self._escape = None
+        self._unicode = ""
+        self._high_surrogate = None
+
+    @property
+    def done(self):
+        return self.state == _DONE
+
+    @property
+    def failed(self):
+        return self.state == _FAILED
+
+    # Key and text of the section still being streamed, or (None, "")
+    def current(self):
+        if self.state == _IN_VALUE:
+            return self._current_key, "".join(self._value)
+        return None, ""
+
+    def _fail(self, message):
+        self.state = _FAILED
+        self.error = message
+
+    def feed(self, delta):
+        events = []
+        text_start = len(self._value) if self.state == _IN_VALUE else 0
+        for char in delta:
+            state = self.state
+            if state in (_DONE, _FAILED):
+                break
+            if state == _BEFORE_OBJECT:
+                if char == "{":
+                    self.state = _BEFORE_KEY
+                else:
+                    self._skipped += 1
+                    if self._skipped > MAX_PREAMBLE_CHARS:
+                        self._fail("no JSON object found")
+            elif state == _BEFORE_KEY:
+                if char == '"':
+                    self._key = []
+                    self.state = _IN_KEY
+                elif char == "}":
+                    self.state = _DONE
+                elif not char.isspace() and char != ",":
+                    self._fail(f"expected a key, got {char!r}")
+            elif state == _IN_KEY:
+                if self._read_string_char(char, self._key):
+                    self._current_key = "".join(self._key)
+                    self.state = _BEFORE_COLON
+            elif state == _BEFORE_COLON:
+                if char == ":":
+                    self.state = _BEFORE_VALUE
+                elif not char.isspace():
+                    self._fail(f"expected ':', got {char!r}")
+            elif state == _BEFORE_VALUE:
+                if char == '"':
+                    self._value = []
+                    text_start = 0
+                    self.state = _IN_VALUE
+                elif not char.isspace():
+                    self._fail(f"value of {self._current_key} is not a string")
+            elif state == _IN_VALUE:
+                if self._read_string_char(char, self._value):
+                    value = "".join(self._value)
+                    if len(value) > text_start:
+                        events.append(("text", self._current_key, value[text_start:]))
+                    self.sections[self._current_key] = value
+                    events.append(("close", self._current_key, value))
+                    self.state = _AFTER_VALUE
+            elif state == _AFTER_VALUE:
+                if char == ",":
+                    self.state = _BEFORE_KEY
+                elif char == "}":
+                    self.state = _DONE
+                elif not char.isspace():
+                    self._fail(f"expected ',' or '}}', got {char!r}")
+        if self.state == _IN_VALUE and len(self._value) > text_start:
+            events.append(("text", self._current_key, "".join(self._value[text_start:])))
+        return events
+
+    # Read one character of a JSON string into `out`; True when the string closed
+    def _read_string_char(self, char, out):
+        if self._escape is None:
+            if char == '"':
+                return True
+            if char == "\\":
+                self._escape = ""
+            else:
+                out.append(char)
+        elif self._escape == "":
+            if char == "u":
+                self._escape = "u"
+                self._unicode = ""
+            else:
+                # Unknown escapes are kept as the escaped character
+                out.append(_ESCAPES.get(char, char))
+                self._escape = None
+        else:
+            self._unicode += char
+            if len(self._unicode) == 4:
+                self._escape = None
+                try:
+                    code = int(self._unicode, 16)
+                except ValueError:
+                    self._fail(f"invalid unicode escape \\u{self._unicode}")
+                    return False
+                if 0xD800 <= code < 0xDC00:
+                    self._high_surrogate = code
+                elif 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+                    out.append(chr(0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)))
+                    self._high_surrogate = None
+                else:
+                    out.append(chr(code))
+        return False
+
+    # Function to get the parsed sections once the stream has ended.
+    # A response cut off by the output limit keeps the sections completed so
+    # far plus the text of the one being written. Returns None when the
+    # response could not be parsed, so the caller falls back to prose.
+    def result(self, keys):
+        if self.failed:
+            return None
+        sections = {key: self.sections[key] for key in keys if key in self.sections}
+        key, text = self.current()
+        if key in keys and key not in sections and text:
+            sections[key] = text
+        return sections or None
@@ -0,0 +1,117 @@
+import re
+
+# Context window of each model, in tokens
+MODEL_CONTEXT_WINDOWS = {
+    "llama3-8b-8192": 8192,
+    "llama3-70b-8192": 8192,
+    "llama-3.1-8b-instant": 131072,
+    "llama-3.3-70b-versatile": 131072,
+    "mixtral-8x7b-32768": 32768,
+    "gemma2-9b-it": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Output budget per pipeline step; the input budget is whatever the context
+# window leaves after the output, the system prompt and a safety margin
+STEP_MAX_OUTPUT_TOKENS = {
+    "initial_analysis": 1024,
+    "critique": 1024,
+    "optimization": 1536,
+}
+DEFAULT_MAX_OUTPUT_TOKENS = 1024
+SAFETY_MARGIN_TOKENS = 64
+
+# Words, numbers and single punctuation marks; long words count as several tokens
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_CHARS_PER_WORD_TOKEN = 6
+_LIST_ITEM_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+\S")
+TRUNCATION_MARKER = "\n[...]"
+
+
+# Function to estimate the number of tokens in a text without calling the API.
+# It is a local approximation of a BPE tokenizer, close enough to plan budgets.
+def count_tokens(text):
+    if not text:
+        return 0
+    count = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        count += 1 + (len(piece) - 1) // _CHARS_PER_WORD_TOKEN
+    return count
+
+
+def max_output_tokens(step):
+    return STEP_MAX_OUTPUT_TOKENS.get(step, DEFAULT_MAX_OUTPUT_TOKENS)
+
+
+# Function to work out how many prompt tokens a step may use with a model.
+# max_tokens overrides the step's default output budget.
+def input_budget(step, model, system_prompt, max_tokens=None):
+    context_window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    if max_tokens is None:
+        max_tokens = max_output_tokens(step)
+    return context_window - max_tokens - count_tokens(system_prompt) - SAFETY_MARGIN_TOKENS
+
+
+# Function to cut a text down to at most max_tokens (estimated), keeping its start
+def fit_to_budget(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max(0, max_tokens - count_tokens(TRUNCATION_MARKER))
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        piece = match.group()
+        count += 1 + (len(piece) - 1) // _CHARS_PER_WORD_TOKEN
+        if count > budget:
+            return text[:match.start()].rstrip() + TRUNCATION_MARKER
+    return text
+
+
+# Function to split an analysis into (label, text) sections at the canvas
+# component headings it contains. Text before the first heading gets label None.
+def split_sections(text, labels):
+    heading = re.compile(
+        r"^[#*\s\d.]*(" + "|".join(re.escape(label) for label in labels) + r")\b",
+        re.IGNORECASE | re.MULTILINE
+    )
+    matches = list(heading.finditer(text))
+    if not matches:
+        return [(None, text)]
+    sections = []
+    if matches[0].start() > 0:
+        sections.append((None, text[:matches[0].start()]))
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        sections.append((match.group(1).lower(), text[match.start():end]))
+    return sections
+
+
+# Function to keep only the issue list of a critique (its bullet and numbered items).
+# A critique without list items is returned unchanged.
+def extract_issues(critique):
+    issues = [line.strip() for line in critique.splitlines() if _LIST_ITEM_PATTERN.match(line)]
+    return "\n".join(issues) if issues else critique
+
+
+# Function to find the canvas components a text talks about
+def mentioned_labels(text, labels):
+    lowered = text.lower()
+    return [label for label in labels if label.lower() in lowered]
+
+
+# Function to shrink an analysis to max_tokens. Sections for the components in
+# keep_labels are preferred; the remaining budget is shared evenly between the
+# kept sections so none of them is dropped entirely.
+def compact_sections(text, labels, max_tokens, keep_labels=None):
+    sections = [(label, body) for label, body in split_sections(text, labels) if label is not None]
+    if not sections:
+        return fit_to_budget(text, max_tokens)
+    if keep_labels:
+        wanted = {label.lower() for label in keep_labels}
+        relevant = [(label, body) for label, body in sections if label in wanted]
+        if relevant:
+            sections = relevant
+    compacted = "\n".join(body.strip() for _, body in sections)
+    if count_tokens(compacted) <= max_tokens:
+        return compacted
+    per_section = max(1, max_tokens // len(sections) - 1)
+    return "\n".join(fit_to_budget(body.strip(), per_section) for _, body in sections)